@@ -0,0 +1 @@
+__author__ = "avraham.shukron@gmail.com"
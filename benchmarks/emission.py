@@ -0,0 +1,160 @@
+"""
+Measures the emission speed of the synthetic trees of ``benchmarks.trees``.
+
+Every combination of tree and target runs in a fresh process, so its peak
+memory is measured in isolation. The results are printed, or written to a
+file, as JSON.
+
+Usage::
+
+    python -m benchmarks.emission [--size N] [--repeat N] [--output PATH]
+"""
+import argparse
+from cStringIO import StringIO
+from io import FileIO
+import json
+from multiprocessing import Pool
+import os
+import platform
+import resource
+import shutil
+import tempfile
+import time
+
+from benchmarks.trees import TREES
+from pyper.core.source import BinarySourceFile
+from pyper.lang.python.source import PythonSourceFile
+
+
+def _stringio_target(path):
+    stream = StringIO()
+    return PythonSourceFile(stream), stream
+
+
+def _buffered_stringio_target(path):
+    stream = StringIO()
+    return PythonSourceFile(stream, buffer_size=1024), stream
+
+
+def _file_target(path):
+    stream = open(path, "wb")
+    return PythonSourceFile(stream, buffer_size=1024), stream
+
+
+def _binary_file_target(path):
+    stream = FileIO(path, "w")
+    return BinarySourceFile(stream,
+                            indentation=PythonSourceFile.FOUR_SPACES), stream
+
+
+#: Factories of source files, taking the path of the file to write to, and
+#: returning the source file and its stream.
+TARGETS = {
+    "stringio": _stringio_target,
+    "buffered_stringio": _buffered_stringio_target,
+    "file": _file_target,
+    "binary_file": _binary_file_target,
+}
+
+
+def _output(stream, path):
+    if hasattr(stream, "getvalue"):
+        return stream.getvalue()
+    stream.close()
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def run_case(case):
+    """
+    Runs a single benchmark case.
+
+    :param case: A ``(tree, target, size, repeat)`` tuple.
+    :return: The measurements of the case.
+    :rtype: dict
+    """
+    tree, target, size, repeat = case
+    elements, count = TREES[tree](size)
+    directory = tempfile.mkdtemp()
+    try:
+        best = None
+        for _ in range(repeat):
+            path = os.path.join(directory, "out.py")
+            source_file, stream = TARGETS[target](path)
+            for element in elements:
+                source_file.add_element(element)
+            start = time.time()
+            source_file.emit()
+            elapsed = time.time() - start
+            output = _output(stream, path)
+            best = elapsed if best is None else min(best, elapsed)
+    finally:
+        shutil.rmtree(directory)
+
+    lines = output.count("\n")
+    return {
+        "tree": tree,
+        "target": target,
+        "elements": count,
+        "seconds": best,
+        "bytes": len(output),
+        "lines": lines,
+        "bytes_per_second": len(output) / best,
+        "lines_per_second": lines / best,
+        "seconds_per_element": best / count,
+        "peak_memory_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def run(trees, targets, size, repeat):
+    """
+    Runs every combination of the given trees and targets, each in a new
+    process.
+
+    :return: A JSON serializable report.
+    :rtype: dict
+    """
+    cases = [(tree, target, size, repeat)
+             for tree in trees for target in targets]
+    pool = Pool(1, maxtasksperchild=1)
+    try:
+        results = pool.map(run_case, cases, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "size": size,
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--size", type=int, default=20000,
+                        help="Number of dominant elements in every tree")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Number of emissions per case; the fastest "
+                             "is reported")
+    parser.add_argument("--tree", action="append", choices=sorted(TREES),
+                        help="Tree to run (default: all)")
+    parser.add_argument("--target", action="append", choices=sorted(TARGETS),
+                        help="Target to run (default: all)")
+    parser.add_argument("--output", help="Write the report to this file")
+    args = parser.parse_args()
+
+    report = run(args.tree or sorted(TREES), args.target or sorted(TARGETS),
+                 args.size, args.repeat)
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
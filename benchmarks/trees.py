@@ -0,0 +1,90 @@
+"""
+Generators of synthetic code element trees with realistic shapes.
+
+Every generator takes a ``size`` and returns a ``(elements, count)`` pair:
+The top level elements of a source file, and the number of elements of the
+type that dominates the tree.
+"""
+from pyper.core.code import TextCodeElement
+from pyper.lang.python.code import Class, FunctionDeclaration, Parameters, \
+    Decorator, IfStatement, ElifStatement, ElseStatement
+
+
+def wide_classes(size):
+    """
+    Classes with many decorated methods each.
+    """
+    methods_per_class = 50
+    elements = []
+    for i in range(max(size // methods_per_class, 1)):
+        cls = Class("Class%d" % (i,), ("Base", "Mixin"))
+        for j in range(methods_per_class):
+            method = FunctionDeclaration(
+                "method_%d" % (j,),
+                Parameters(("self", "a", "b"), (("key", "None"),)),
+                TextCodeElement("return a + b")
+            )
+            method.add_decorator(Decorator("decorator"))
+            cls.add_method(method)
+        elements.append(cls)
+    return elements, len(elements) * methods_per_class
+
+
+def elif_chains(size):
+    """
+    Functions made of long ``if``/``elif``/``else`` chains.
+    """
+    branches_per_chain = 100
+    elements = []
+    for i in range(max(size // branches_per_chain, 1)):
+        statement = ElseStatement(TextCodeElement("return None"))
+        for j in range(branches_per_chain):
+            statement = ElifStatement(TextCodeElement("x == %d" % (j,)),
+                                      TextCodeElement("return %d" % (j,)),
+                                      statement)
+        elements.append(FunctionDeclaration(
+            "decide_%d" % (i,), Parameters(("x",)),
+            IfStatement(TextCodeElement("x is None"),
+                        TextCodeElement("return -1"), statement)
+        ))
+    return elements, len(elements) * branches_per_chain
+
+
+def huge_parameters(size):
+    """
+    Functions with very long parameter lists.
+    """
+    parameters_per_function = 1000
+    elements = []
+    for i in range(max(size // parameters_per_function, 1)):
+        half = parameters_per_function // 2
+        parameters = Parameters(
+            tuple("arg_%d" % (j,) for j in range(half)),
+            tuple(("key_%d" % (j,), j) for j in range(half))
+        )
+        elements.append(FunctionDeclaration("function_%d" % (i,),
+                                            parameters))
+    return elements, len(elements) * parameters_per_function
+
+
+def text_blocks(size):
+    """
+    Functions containing large blocks of free text.
+    """
+    lines_per_block = 1000
+    elements = []
+    for i in range(max(size // lines_per_block, 1)):
+        text = TextCodeElement("values = []")
+        for j in range(lines_per_block - 1):
+            text.add_line("values.append(%d)" % (j,))
+        elements.append(FunctionDeclaration("function_%d" % (i,),
+                                            body=text))
+    return elements, len(elements) * lines_per_block
+
+
+TREES = {
+    "wide_classes": wide_classes,
+    "elif_chains": elif_chains,
+    "huge_parameters": huge_parameters,
+    "text_blocks": text_blocks,
+}
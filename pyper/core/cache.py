@@ -0,0 +1,113 @@
+from collections import OrderedDict
+
+from pyper.core.code import CodeElement
+
+
+class FragmentCache(object):
+    """
+    A bounded cache of rendered code fragments.
+    When full, the least recently used fragment is evicted.
+    """
+
+    DEFAULT_SIZE = 1024
+
+    def __init__(self, max_size=DEFAULT_SIZE):
+        """
+        Initializes a new fragment cache.
+
+        :param max_size: The maximal number of fragments to keep.
+        :type max_size: int
+        """
+        self._max_size = max_size
+        self._fragments = OrderedDict()
+
+    def get(self, key):
+        """
+        Returns the fragment stored under ``key``, or ``None`` if there is no
+        such fragment.
+        """
+        fragment = self._fragments.pop(key, None)
+        if fragment is not None:
+            self._fragments[key] = fragment
+        return fragment
+
+    def put(self, key, fragment):
+        """
+        Stores a fragment, evicting the least recently used one if the cache
+        is full.
+        """
+        self._fragments.pop(key, None)
+        self._fragments[key] = fragment
+        if len(self._fragments) > self._max_size:
+            self._fragments.popitem(last=False)
+
+    def clear(self):
+        self._fragments.clear()
+
+    def __len__(self):
+        return len(self._fragments)
+
+
+DEFAULT_FRAGMENT_CACHE = FragmentCache()
+
+
+class FrozenCodeElement(CodeElement):
+    """
+    Wraps a code element that never changes once built.
+    The wrapped element is rendered once per source file layout, and every
+    later emission with the same layout writes the cached text as one block.
+
+    The cache belongs to the process, so it is not part of the pickled or
+    serialized state. A loaded frozen element uses the default cache.
+    """
+
+    __slots__ = ("element", "_cache")
+
+    def __init__(self, element, cache=DEFAULT_FRAGMENT_CACHE):
+        """
+        Initializes a new frozen code element.
+
+        :param element: The element to freeze. It must not be modified
+            afterwards.
+        :type element: CodeElement
+        :param cache: The cache holding the rendered fragments.
+        :type cache: FragmentCache
+        """
+        self.element = element
+        self._cache = cache
+
+    def __getstate__(self):
+        state = CodeElement.__getstate__(self)
+        del state["_cache"]
+        return state
+
+    def __setstate__(self, state):
+        CodeElement.__setstate__(self, state)
+        self._cache = DEFAULT_FRAGMENT_CACHE
+
+    def fields(self):
+        return (self.element,)
+
+    def map_children(self, function):
+        self.element = function(self.element)
+
+    def emit(self, source_file):
+        key = (self, source_file.layout())
+        fragment = self._cache.get(key)
+        if fragment is None:
+            fragment = source_file.render(self.element)
+            self._cache.put(key, fragment)
+        source_file.write_rendered(*fragment)
+
+
+def freeze(element, cache=DEFAULT_FRAGMENT_CACHE):
+    """
+    Marks a code element as frozen.
+
+    :param element: The element to freeze.
+    :type element: CodeElement
+    :param cache: The cache holding the rendered fragments.
+    :type cache: FragmentCache
+    :rtype: FrozenCodeElement
+    """
+    return FrozenCodeElement(element, cache)
@@ -1,4 +1,4 @@
-from StringIO import StringIO
+from pyper.core.source import SourceFile
 
 
 class CodeElement(object):
@@ -6,6 +6,65 @@ class CodeElement(object):
     Base class for any code element
     """
 
+    __slots__ = ("_parent", "_dirty", "_rendered")
+
+    #: Whether incremental emission keeps the rendered output of elements of
+    #: this type, and reuses it as long as the element is not changed.
+    CACHEABLE = False
+
+    #: Whether instances of this type are shared between trees. Shared
+    #: elements never change, and have no parent.
+    SHARED = False
+
+    def __new__(cls, *args, **kwargs):
+        element = object.__new__(cls)
+        element._parent = None
+        element._dirty = True
+        element._rendered = None
+        return element
+
+    def __getstate__(self):
+        # The parent and the rendered code are not pickled, so a pickled
+        # element does not drag its ancestors along.
+        state = dict((name, getattr(self, name))
+                     for name in _state_slots(self.__class__)
+                     if hasattr(self, name))
+        state.update(getattr(self, "__dict__", ()))
+        return state
+
+    def __setstate__(self, state):
+        # Older pickle protocols do not create the element through __new__.
+        self._parent = None
+        self._dirty = True
+        self._rendered = None
+        for name, value in state.iteritems():
+            setattr(self, name, value)
+
+    def mark_dirty(self):
+        """
+        Marks this element and all of its ancestors as changed, so the next
+        incremental emission renders them again.
+        Must be called by any method that changes the emitted code.
+        """
+        element = self
+        while element is not None:
+            element._dirty = True
+            element = element._parent
+
+    def is_dirty(self):
+        return self._dirty
+
+    def _adopt(self, element):
+        """
+        Registers this element as the parent of ``element``, so that changes
+        to ``element`` mark this element as dirty as well.
+
+        :return: ``element``
+        """
+        if element is not None and not element.SHARED:
+            element._parent = self
+        return element
+
     def emit(self, source_file):
         """
         Emits the current code element into the supplied source file.
@@ -16,20 +75,207 @@ class CodeElement(object):
         raise NotImplementedError("%s is an Abstract class." %
                                   (self.__class__.__name__,))
 
+    def fields(self):
+        """
+        Returns the values that determine the code this element emits, with
+        the child elements themselves in place of their values.
+        Elements of the same type and equal fields emit the same code.
+
+        :rtype: tuple
+        """
+        raise NotImplementedError("%s does not describe its fields." %
+                                  (self.__class__.__name__,))
+
+    def structure(self):
+        """
+        Returns a hashable description of the code this element emits: Its
+        type and its fields, with the structure of the child elements in
+        place of the elements.
+
+        :rtype: tuple
+        """
+        return ((self.__class__.__module__, self.__class__.__name__) +
+                map_elements(self.fields(), CodeElement.structure))
+
+    def structure_key(self):
+        """
+        Returns a hashable key of the code this element emits. Elements emit
+        the same code if their keys are equal. Unlike in ``structure``,
+        values of different types, such as ``1`` and ``True``, are never
+        equal.
+        """
+        return strict_key(self.structure(), None)
+
+    def same_structure(self, other):
+        """
+        Returns whether this element emits the same code as ``other``,
+        comparing their ``structure_key``.
+        """
+        return self is other or (
+            isinstance(other, CodeElement) and
+            self.structure_key() == other.structure_key())
+
+    def map_children(self, function):
+        """
+        Replaces every child element with the result of calling ``function``
+        on it. The replacement must emit the same code as the child.
+        Elements that have child elements must implement this method to
+        allow structurally equal children to be shared.
+
+        :param function: A function of a code element, returning a code
+            element.
+        """
+        pass
+
+    def emit_steps(self, source_file):
+        """
+        Emits the current code element into the supplied source file in
+        steps. Returns an iterable that emits the next part of the element
+        each time it is advanced, and yields the child elements that must be
+        emitted, in steps as well, before advancing it again.
+
+        The default emits the whole element in one step.
+
+        :param source_file:
+        :type source_file: pyper.core.source.SourceFile
+        :return: An iterable of child code elements.
+        """
+        self.emit(source_file)
+        return ()
+
+    def iter_emit(self, source_file,
+                  chunk_size=SourceFile.DEFAULT_CHUNK_SIZE):
+        """
+        Emits the current code element lazily, yielding the code in chunks
+        instead of writing it to the stream of the source file.
+
+        :param source_file:
+        :type source_file: pyper.core.source.SourceFile
+        :param chunk_size: The minimal length of every chunk but the last.
+        :type chunk_size: int
+        :return: An iterator over the chunks of the code.
+        """
+        return source_file.iter_emit_elements((self,), chunk_size)
+
+
+_STATE_SLOTS = {}
+
+
+def _state_slots(cls):
+    """
+    Returns the slots of a code element type that are pickled.
+    """
+    slots = _STATE_SLOTS.get(cls)
+    if slots is None:
+        slots = []
+        for klass in cls.__mro__:
+            names = klass.__dict__.get("__slots__", ())
+            if isinstance(names, basestring):
+                names = (names,)
+            slots.extend(name for name in names if name not in (
+                "_parent", "_dirty", "_rendered", "__dict__", "__weakref__"))
+        slots = _STATE_SLOTS[cls] = tuple(slots)
+    return slots
+
+
+def overrides(element, base, names):
+    """
+    Returns whether the type of an element overrides any of the given
+    methods of ``base``. Elements that emit themselves in steps use it to
+    fall back to their ``emit`` when a subclass changes how they are
+    emitted, since the steps would not call the overriding methods.
+
+    :param element: The code element.
+    :param base: The class defining the methods.
+    :param names: The names of the methods.
+    :type names: tuple
+    :rtype: bool
+    """
+    key = (element.__class__, base, names)
+    result = _OVERRIDES.get(key)
+    if result is None:
+        result = _OVERRIDES[key] = any(
+            getattr(element.__class__, name).im_func is not
+            base.__dict__[name] for name in names)
+    return result
+
+
+_OVERRIDES = {}
+
+
+def map_elements(value, function):
+    """
+    Replaces every code element in a value, which may be a nested tuple or
+    list, with the result of calling ``function`` on it.
+    Lists are replaced with tuples that start with ``list``, so the result
+    is hashable and still tells lists and tuples apart.
+    """
+    if isinstance(value, CodeElement):
+        return function(value)
+    if isinstance(value, tuple):
+        return tuple(map_elements(item, function) for item in value)
+    if isinstance(value, list):
+        return (list,) + tuple(map_elements(item, function)
+                               for item in value)
+    return value
+
+
+def strict_key(value, element_key):
+    """
+    Returns a hashable key of a value, which may be a nested tuple or list,
+    that differs for values of different types.
+
+    :param value: The value.
+    :param element_key: A function returning the key of a code element, or
+        ``None`` if the value contains no code elements.
+    """
+    value_class = value.__class__
+    if value_class in _EXACT_TYPES:
+        return value_class, value
+    if value_class is tuple or value_class is list:
+        return value_class, tuple([strict_key(item, element_key)
+                                   for item in value])
+    if isinstance(value, CodeElement):
+        return element_key(value)
+    if value_class is float:
+        # Distinguishes 0.0 from -0.0.
+        return float, repr(value)
+    return value_class, value
+
+
+_EXACT_TYPES = frozenset((str, unicode, int, long, bool, type(None)))
+
 
 class TextCodeElement(CodeElement):
     """
     A basic code element for free text.
     Used mainly for lazy testing stuff, and generally discouraged as an actual
     code element.
+
+    The text is kept as a list of lines. Every line is written at the current
+    indentation level, so multi-line text is indented along with the code
+    around it.
     """
+
+    __slots__ = ("lines",)
+
     def __init__(self, initial_value):
-        self.text = StringIO()
-        self.text.write(initial_value)
+        self.lines = _split_lines(initial_value)
+
+    @property
+    def text(self):
+        return "\n".join(self.lines)
 
     def add_line(self, line):
-        self.text.write("\n" + line)
+        self.lines.extend(_split_lines(line))
+        self.mark_dirty()
+
+    def fields(self):
+        return (tuple(self.lines),)
 
     def emit(self, source_file):
-        source_file.write(self.text.getvalue())
-        self.text.close()
+        source_file.write_lines(self.lines)
+
+
+def _split_lines(text):
+    return text.replace("\r\n", "\n").split("\n")
@@ -0,0 +1,190 @@
+import errno
+import os
+import stat
+import tempfile
+
+
+def _read_umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+# Read once, since reading the umask changes it for a moment, and files may
+# be created by other threads.
+_UMASK = _read_umask()
+
+
+def replace_file(source, destination):
+    """
+    Renames ``source`` to ``destination``, replacing it if it exists.
+    The replacement is atomic where the platform supports it.
+    """
+    try:
+        os.rename(source, destination)
+    except OSError:
+        # Windows does not rename over existing files.
+        if not os.path.exists(destination):
+            raise
+        os.remove(destination)
+        os.rename(source, destination)
+
+
+def _replacement_mode(path):
+    """
+    Returns the permissions of the file at ``path``, or the permissions that
+    ``open`` gives a new file if there is no such file.
+    """
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        return 0o666 & ~_UMASK
+
+
+class AtomicFile(object):
+    """
+    A binary file that is written under a temporary name, and replaces the
+    file at its path only when it is closed.
+    Readers of the path never see a partially written file. The file keeps
+    the permissions of the file it replaces, and a new file gets the
+    permissions that ``open`` would give it.
+    """
+
+    def __init__(self, path):
+        """
+        Creates the temporary file.
+
+        :param path: The path of the file to replace when closed.
+        :type path: str
+        """
+        self.path = path
+        directory, name = os.path.split(path)
+        fd, self._temp_path = tempfile.mkstemp(prefix="." + name + ".",
+                                               suffix=".tmp",
+                                               dir=directory or ".")
+        self._file = os.fdopen(fd, "wb")
+
+    def write(self, data):
+        self._file.write(data)
+
+    def close(self):
+        """
+        Closes the file, and moves it to its path.
+        """
+        if not self._file.closed:
+            self._file.close()
+            # Temporary files are only accessible by their owner.
+            os.chmod(self._temp_path, _replacement_mode(self.path))
+            replace_file(self._temp_path, self.path)
+
+    def discard(self):
+        """
+        Closes the file and deletes it, leaving the file at the path
+        untouched.
+        """
+        if not self._file.closed:
+            self._file.close()
+            os.remove(self._temp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+class WriteIfChangedFile(object):
+    """
+    A binary file that replaces the file at its path only if its content
+    differs from the content of that file.
+
+    Written data is compared with the existing file as it is written, so
+    the whole content is never held in memory. Once the content differs,
+    the part that matched is copied into an ``AtomicFile``, and the rest of
+    the data is written to it. If the content is identical, the existing
+    file is left untouched, keeping its modification time.
+    """
+
+    COPY_CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, path):
+        """
+        Opens the existing file, if there is one.
+
+        :param path: The path of the file to replace when closed, if changed.
+        :type path: str
+        """
+        self.path = path
+        #: Whether the content differs from the existing file. Only final
+        #: once the file is closed.
+        self.changed = False
+        self._matched = 0
+        self._file = None
+        try:
+            self._existing = open(path, "rb")
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            self._existing = None
+            self._diverge()
+
+    def write(self, data):
+        if self._file is None:
+            if self._existing.read(len(data)) == data:
+                self._matched += len(data)
+                return
+            self._diverge()
+        self._file.write(data)
+
+    def _diverge(self):
+        """
+        Starts writing a new file, beginning with the part of the existing
+        file that matched the data written so far.
+        """
+        self.changed = True
+        self._file = AtomicFile(self.path)
+        if self._existing is not None:
+            self._existing.seek(0)
+            remaining = self._matched
+            while remaining:
+                chunk = self._existing.read(min(remaining,
+                                                self.COPY_CHUNK_SIZE))
+                self._file.write(chunk)
+                remaining -= len(chunk)
+            self._existing.close()
+
+    def close(self):
+        """
+        Closes the file, and moves it to its path if its content changed.
+        """
+        if self._file is None:
+            if self._existing.closed or not self._existing.read(1):
+                self._existing.close()
+                return
+            # The existing file is longer.
+            self._diverge()
+        self._file.close()
+
+    def discard(self):
+        """
+        Closes the file and deletes it, leaving the file at the path
+        untouched.
+        """
+        if self._existing is not None:
+            self._existing.close()
+        if self._file is not None:
+            self._file.discard()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
@@ -0,0 +1,136 @@
+import time
+
+
+class ElementStats(object):
+    """
+    Emission statistics of one type of code element.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.total_time = 0.0
+        self.self_time = 0.0
+        self.size = 0
+        self.lines = 0
+        # The number of elements of this type currently being emitted, so
+        # the totals of recursive elements are counted only once.
+        self._active = 0
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "calls": self.calls,
+            "total_time": self.total_time,
+            "self_time": self.self_time,
+            "size": self.size,
+            "lines": self.lines,
+        }
+
+
+class _Frame(object):
+
+    def __init__(self, element, stats, start, size, lines):
+        self.element = element
+        self.stats = stats
+        self.start = start
+        self.size = size
+        self.lines = lines
+        self.children_time = 0.0
+
+
+class EmissionProfiler(object):
+    """
+    Records, per type of code element, how many elements were emitted, how
+    long it took, and how much code they produced.
+
+    Attach a profiler to a source file with ``SourceFile.set_profiler``.
+    Every element emitted through ``SourceFile.emit_element`` is recorded,
+    which includes all the elements emitted by ``emit`` and
+    ``emit_incremental``. A source file without a profiler pays nothing for
+    this.
+    """
+
+    def __init__(self, callbacks=(), clock=time.time):
+        """
+        Initializes a new profiler.
+
+        :param callbacks: Callables to call after every element is emitted,
+            with the element, its nesting depth, the time it took, and the
+            length of the code it produced.
+        :param clock: Returns the current time in seconds.
+        """
+        self.callbacks = list(callbacks)
+        self.stats = {}
+        self.max_depth = 0
+        self._clock = clock
+        self._stack = []
+        self._size = 0
+        self._lines = 0
+
+    def wrap_put(self, put, line_separator):
+        """
+        Wraps the function a source file writes its text with, to count the
+        produced code.
+        """
+        def counting_put(text):
+            put(text)
+            self._size += len(text)
+            self._lines += text.count(line_separator)
+        return counting_put
+
+    def wrap_emit_element(self, emit_element):
+        """
+        Wraps ``SourceFile.emit_element`` to record every emitted element.
+        """
+        def profiled_emit_element(element):
+            if element is None:
+                return emit_element(element)
+            self.element_started(element)
+            try:
+                return emit_element(element)
+            finally:
+                self.element_finished()
+        return profiled_emit_element
+
+    def element_started(self, element):
+        name = element.__class__.__name__
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = ElementStats(name)
+        stats.calls += 1
+        stats._active += 1
+        self._stack.append(_Frame(element, stats, self._clock(), self._size,
+                                  self._lines))
+        self.max_depth = max(self.max_depth, len(self._stack))
+
+    def element_finished(self):
+        frame = self._stack.pop()
+        elapsed = self._clock() - frame.start
+        size = self._size - frame.size
+        stats = frame.stats
+        stats._active -= 1
+        stats.self_time += elapsed - frame.children_time
+        if not stats._active:
+            stats.total_time += elapsed
+            stats.size += size
+            stats.lines += self._lines - frame.lines
+        if self._stack:
+            self._stack[-1].children_time += elapsed
+
+        for callback in self.callbacks:
+            callback(frame.element, len(self._stack), elapsed, size)
+
+    def report(self):
+        """
+        Returns the recorded statistics, slowest element type first.
+
+        :rtype: dict
+        """
+        return {
+            "max_depth": self.max_depth,
+            "elements": [stats.as_dict() for stats in
+                         sorted(self.stats.values(),
+                                key=lambda stats: stats.self_time,
+                                reverse=True)],
+        }
@@ -0,0 +1,165 @@
+from pyper.core.cache import DEFAULT_FRAGMENT_CACHE, FrozenCodeElement
+from pyper.core.code import CodeElement, strict_key
+
+
+class Interner(object):
+    """
+    Collapses structurally equal code elements into a single, shared
+    instance, so repetitive trees take less memory.
+
+    Elements are compared by their type and fields, with the children
+    compared by identity after they were interned themselves, so every
+    element is described once no matter how deep it is. Elements whose
+    fields cannot be described, or contain unhashable values, are kept as
+    they are.
+
+    Interned elements may have many parents, so they must not be modified
+    afterwards.
+    """
+
+    def __init__(self, freeze_repeated=False, cache=DEFAULT_FRAGMENT_CACHE):
+        """
+        :param freeze_repeated: Whether cacheable elements that appear more
+            than once are also frozen, so that they are rendered once per
+            layout, and their code is reused for every other appearance.
+        :type freeze_repeated: bool
+        :param cache: The cache of the rendered code of frozen elements.
+        :type cache: pyper.core.cache.FragmentCache
+        """
+        self._freeze_repeated = freeze_repeated
+        self._cache = cache
+        self._canonical = {}
+
+    def __len__(self):
+        """
+        Returns the number of distinct elements seen so far.
+        """
+        return len(self._canonical)
+
+    def intern(self, elements):
+        """
+        Interns the trees of the given elements. Child elements are
+        replaced in place with their shared instances.
+
+        :param elements: An iterable of code elements.
+        :return: A list of the shared instances of the given elements.
+        :rtype: list[CodeElement]
+        """
+        elements = list(elements)
+        replacements = {}
+
+        def replace(child):
+            return replacements.get(id(child), child)
+
+        def child_key(child):
+            return id(replacements.get(id(child), child))
+
+        canonical_elements = self._canonical
+        for element, fields in _post_order(elements):
+            canonical = element
+            if fields is not None:
+                try:
+                    key = (element.__class__, strict_key(fields, child_key))
+                    canonical = canonical_elements.get(key)
+                except TypeError:
+                    # The fields contain unhashable values.
+                    canonical = element
+                else:
+                    if canonical is None:
+                        canonical = canonical_elements[key] = element
+            # Duplicates are dropped, so only their replacements need to
+            # refer to the shared children.
+            if canonical is element:
+                element.map_children(replace)
+            else:
+                replacements[id(element)] = canonical
+
+        elements = [replace(element) for element in elements]
+        if self._freeze_repeated:
+            elements = self._freeze(elements)
+        return elements
+
+    def _freeze(self, elements):
+        trees = [element for element, _ in _post_order(elements)]
+        uses = {}
+        for element in elements + [child for element in trees
+                                   for child in _children(element)]:
+            uses[id(element)] = uses.get(id(element), 0) + 1
+
+        frozen = {}
+
+        def replace(element):
+            if element.CACHEABLE and uses.get(id(element), 0) > 1:
+                replacement = frozen.get(id(element))
+                if replacement is None:
+                    replacement = frozen[id(element)] = FrozenCodeElement(
+                        element, self._cache)
+                return replacement
+            return element
+
+        for element in trees:
+            element.map_children(replace)
+        return [replace(element) for element in elements]
+
+
+def _fields(element):
+    try:
+        return element.fields()
+    except NotImplementedError:
+        return None
+
+
+def _children(element, fields=None):
+    if fields is None:
+        fields = _fields(element)
+    children = []
+    if fields is not None:
+        _collect_children(fields, children)
+    return children
+
+
+def _collect_children(value, children):
+    for item in value:
+        item_class = item.__class__
+        if item_class is tuple or item_class is list:
+            _collect_children(item, children)
+        elif isinstance(item, CodeElement):
+            children.append(item)
+
+
+def _post_order(elements):
+    """
+    Returns every element in the given trees once, after all of its
+    children, along with its fields, or ``None`` if it does not describe
+    them.
+    """
+    visited = set()
+    order = []
+    stack = [(element, None, False) for element in reversed(elements)]
+    while stack:
+        element, fields, expanded = stack.pop()
+        if expanded:
+            order.append((element, fields))
+        elif id(element) not in visited:
+            visited.add(id(element))
+            fields = _fields(element)
+            stack.append((element, fields, True))
+            if fields is not None:
+                stack.extend((child, None, False)
+                             for child in _children(element, fields)
+                             if id(child) not in visited)
+    return order
+
+
+def intern_elements(elements, freeze_repeated=False):
+    """
+    Interns the trees of the given elements, using a new ``Interner``.
+
+    :param elements: An iterable of code elements.
+    :param freeze_repeated: Whether repeated cacheable elements are frozen.
+        See ``Interner``.
+    :type freeze_repeated: bool
+    :return: A list of the shared instances of the given elements.
+    :rtype: list[CodeElement]
+    """
+    return Interner(freeze_repeated).intern(elements)
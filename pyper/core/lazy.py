@@ -0,0 +1,56 @@
+from itertools import chain
+
+
+class LazyElements(object):
+    """
+    Code elements that are pulled from an iterable only as they are
+    emitted, and are not kept afterwards. The elements can therefore be
+    emitted only once.
+    """
+
+    def __init__(self, iterable):
+        """
+        :param iterable: An iterable of code elements, such as a generator.
+        """
+        self._iterator = iter(iterable)
+        self._peeked = []
+
+    def __nonzero__(self):
+        """
+        Returns whether any elements remain, pulling at most one element.
+        """
+        if not self._peeked:
+            for element in self._iterator:
+                self._peeked.append(element)
+                break
+        return bool(self._peeked)
+
+    def __iter__(self):
+        peeked, self._peeked = self._peeked, []
+        return chain(peeked, self._iterator)
+
+
+def iter_elements(items):
+    """
+    Iterates over a list of code elements and ``LazyElements``, pulling the
+    lazy elements in place.
+    """
+    for item in items:
+        if isinstance(item, LazyElements):
+            for element in item:
+                yield element
+        else:
+            yield item
+
+
+def has_elements(items):
+    """
+    Returns whether a list of code elements and ``LazyElements`` has any
+    elements, pulling as few lazy elements as possible.
+    """
+    return any(item if isinstance(item, LazyElements) else True
+               for item in items)
+
+
+def contains_lazy_elements(items):
+    return any(isinstance(item, LazyElements) for item in items)
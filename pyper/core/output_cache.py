@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+
+from pyper.core.files import AtomicFile
+
+
+def structure_hash(elements, *settings):
+    """
+    Computes a hash of the code emitted by a list of elements, without
+    emitting them.
+
+    :param elements: The code elements. All of them must implement
+        ``CodeElement.fields``.
+    :param settings: Any other values affecting the emitted code, such as
+        the source file type, indentation and line separator.
+    :return: A hexadecimal digest.
+    :rtype: str
+    """
+    digest = hashlib.sha1()
+    digest.update(repr(settings))
+    for element in elements:
+        digest.update("\0")
+        digest.update(repr(element.structure()))
+    return digest.hexdigest()
+
+
+def _file_digest(path, block_size=64 * 1024):
+    """
+    Computes a hash of the content of a file.
+
+    :param path: The path of the file.
+    :type path: str
+    :return: A hexadecimal digest.
+    :rtype: str
+    """
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), ""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class OutputCache(object):
+    """
+    Remembers the structure hash every output file was last written with,
+    across runs, so unchanged files need not be emitted again.
+    The size and the content digest of every written file are remembered as
+    well, so a file that was changed by anything else is written again.
+    """
+
+    def __init__(self, path):
+        """
+        Loads the cache.
+
+        :param path: The path of the cache file. It does not need to exist.
+        :type path: str
+        """
+        self._path = path
+        self._entries = {}
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                self._entries = json.load(f)
+
+    def is_current(self, path, digest):
+        """
+        Returns whether the file at ``path`` was last written with code of
+        the given hash, and its content was not changed since.
+        """
+        entry = self._entries.get(path)
+        # Entries of older caches hold only the structure hash.
+        if not isinstance(entry, list) or entry[0] != digest:
+            return False
+        try:
+            if os.path.getsize(path) != entry[1]:
+                return False
+            return _file_digest(path) == entry[2]
+        except (IOError, OSError):
+            return False
+
+    def update(self, path, digest):
+        """
+        Records that the file at ``path`` was just written with code of the
+        given hash, along with its current size and content digest.
+        """
+        self._entries[path] = [digest, os.path.getsize(path),
+                               _file_digest(path)]
+
+    def remove(self, path):
+        self._entries.pop(path, None)
+
+    def save(self):
+        with AtomicFile(self._path) as f:
+            json.dump(self._entries, f, indent=0, sort_keys=True)
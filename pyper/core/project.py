@@ -0,0 +1,196 @@
+from collections import namedtuple
+import errno
+from multiprocessing import Pool, cpu_count
+from multiprocessing.pool import ThreadPool
+import os
+import traceback
+
+from pyper.core.files import WriteIfChangedFile
+from pyper.core.output_cache import structure_hash
+from pyper.core.source import SourceFile
+
+
+class EmissionResult(namedtuple("EmissionResult",
+                                 ("path", "error", "skipped"))):
+    """
+    The outcome of emitting a single output file.
+    ``error`` is ``None`` on success, or the formatted traceback of the
+    failure otherwise. ``skipped`` is ``True`` if the file was not emitted
+    because it is unchanged.
+    """
+
+    @property
+    def succeeded(self):
+        return self.error is None
+
+
+class OutputFile(object):
+    """
+    A single file of a project: Where to write it, which source file type to
+    write it with, and the code elements it contains.
+    """
+
+    DEFAULT_BUFFER_SIZE = 1024
+
+    def __init__(self, path, elements=(), source_file_class=SourceFile,
+                 **options):
+        """
+        Initializes a new output file.
+
+        :param path: The path of the file.
+        :type path: str
+        :param elements: The top level code elements of the file.
+        :param source_file_class: The type of source file to emit with.
+        :param options: Extra arguments for ``source_file_class``.
+        """
+        self.path = path
+        self.elements = list(elements)
+        self.source_file_class = source_file_class
+        self.options = options
+        self.options.setdefault("buffer_size", self.DEFAULT_BUFFER_SIZE)
+
+    def add_element(self, code_element):
+        self.elements.append(code_element)
+        return self
+
+    def structure_hash(self):
+        """
+        Computes a hash of the code of this file, without emitting it.
+
+        :rtype: str
+        """
+        settings = dict(self.options)
+        settings.pop("buffer_size")
+        return structure_hash(self.elements,
+                              self.source_file_class.__module__,
+                              self.source_file_class.__name__,
+                              sorted(settings.items()))
+
+    def emit(self):
+        """
+        Writes the file atomically, creating its directory if needed.
+        The file is left untouched if its content did not change.
+        """
+        directory = os.path.dirname(self.path)
+        if directory:
+            try:
+                os.makedirs(directory)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+        with WriteIfChangedFile(self.path) as stream:
+            source_file = self.source_file_class(stream, **self.options)
+            for element in self.elements:
+                source_file.add_element(element)
+            source_file.emit()
+
+
+def _emit_output_file(output_file):
+    try:
+        output_file.emit()
+    except Exception:
+        return EmissionResult(output_file.path, traceback.format_exc(),
+                              False)
+    return EmissionResult(output_file.path, None, False)
+
+
+class Project(object):
+    """
+    A tree of output files, that can be emitted in parallel.
+    """
+
+    def __init__(self, root=""):
+        """
+        Initializes a new project.
+
+        :param root: The directory that relative file paths are relative to.
+        :type root: str
+        """
+        self._root = root
+        self._files = []
+
+    def add_file(self, path, elements=(), source_file_class=SourceFile,
+                 **options):
+        """
+        Adds an output file to the project.
+
+        :param path: The path of the file, relative to the project root.
+        :param elements: The top level code elements of the file.
+        :param source_file_class: The type of source file to emit with.
+        :param options: Extra arguments for ``source_file_class``.
+        :return: The new output file.
+        :rtype: OutputFile
+        """
+        output_file = OutputFile(os.path.join(self._root, path), elements,
+                                 source_file_class, **options)
+        self._files.append(output_file)
+        return output_file
+
+    def emit(self, workers=None, processes=False, executor=None, cache=None):
+        """
+        Emits all the files of the project.
+        A failure to emit one file does not stop the others from being
+        emitted.
+
+        :param workers: The number of workers. Defaults to the number of CPUs.
+            If 1, the files are emitted serially in the calling thread.
+        :param processes: Whether to use a process pool instead of a thread
+            pool. All code elements must be picklable.
+        :param executor: An existing pool or executor to emit with, instead
+            of creating one. Must have a ``map`` method that preserves the
+            order of the results.
+        :param cache: If given, files whose structure hash is the same as
+            when they were last emitted with this cache are skipped. The
+            cache is updated and saved after the emission.
+        :type cache: pyper.core.output_cache.OutputCache
+        :return: The result of each file, in the order they were added.
+        :rtype: list[EmissionResult]
+        """
+        if cache is None:
+            return self._emit_files(self._files, workers, processes, executor)
+
+        results = {}
+        digests = {}
+        for output_file in self._files:
+            try:
+                digest = output_file.structure_hash()
+            except Exception:
+                # Some element cannot be hashed, or hashing failed, such as
+                # on trees too deep to describe recursively. The file is
+                # always emitted, and emitting it reports any real error.
+                cache.remove(output_file.path)
+                continue
+            if cache.is_current(output_file.path, digest):
+                results[output_file] = EmissionResult(output_file.path, None,
+                                                      True)
+            else:
+                digests[output_file] = digest
+
+        changed = [output_file for output_file in self._files
+                   if output_file not in results]
+        emitted = self._emit_files(changed, workers, processes, executor)
+        for output_file, result in zip(changed, emitted):
+            results[output_file] = result
+            if result.succeeded and output_file in digests:
+                cache.update(output_file.path, digests[output_file])
+            else:
+                cache.remove(output_file.path)
+        cache.save()
+        return [results[output_file] for output_file in self._files]
+
+    @staticmethod
+    def _emit_files(files, workers, processes, executor):
+        if executor is not None:
+            return list(executor.map(_emit_output_file, files))
+
+        workers = workers if workers is not None else cpu_count()
+        if workers <= 1 or len(files) <= 1:
+            return map(_emit_output_file, files)
+
+        pool = (Pool if processes else ThreadPool)(workers)
+        try:
+            return pool.map(_emit_output_file, files)
+        finally:
+            pool.close()
+            pool.join()
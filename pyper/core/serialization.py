@@ -0,0 +1,337 @@
+"""
+A compact, versioned serialization format for code element trees.
+
+A serialized tree is a header followed by one record per top level element,
+so trees can be written and read one top level element at a time. Every
+record holds the constants and the element layouts it adds to the tables of
+the previous records, and a flat array of operations that describes the
+element in prefix order:
+
+- ``NONE``, ``TRUE``, ``FALSE``.
+- ``INT value`` for integers that fit in 32 bits.
+- ``CONSTANT index`` for strings, floats and other integers, stored once in
+  the constant table.
+- ``TUPLE size items...``, ``LIST size items...``, ``SET size items...``,
+  ``FROZENSET size items...`` and ``DICT size keys-and-values...``.
+- ``ELEMENT layout values...`` for a code element. A layout is an element
+  type and the names of its pickled state (see ``CodeElement.__getstate__``),
+  and is followed by the values of the state in the same order.
+- ``REFERENCE index`` for an element that already appeared in the record,
+  so shared elements stay shared.
+
+A record is the marshalled tuple of the new constants, the new layouts and
+the operations, optionally compressed with zlib.
+
+The format is smaller than a pickle of the same tree, and faster to write,
+but decoding it is not faster than ``cPickle.loads``: In pure Python it
+takes about one and a half to two times as long.
+"""
+from array import array
+from cStringIO import StringIO
+import importlib
+import marshal
+import struct
+import zlib
+
+from pyper.core.code import CodeElement
+
+MAGIC = "PYPR"
+VERSION = 1
+
+#: The header flag of compressed records.
+COMPRESSED = 1
+
+_HEADER = struct.Struct("<4sBB")
+_LENGTH = struct.Struct("<I")
+
+(NONE, TRUE, FALSE, INT, CONSTANT, TUPLE, LIST, SET, FROZENSET, DICT,
+ ELEMENT, REFERENCE) = range(12)
+
+_CONTAINERS = {tuple: TUPLE, list: LIST, set: SET, frozenset: FROZENSET}
+_CONSTANTS = frozenset((str, unicode, float, long))
+_INT_MIN = -2 ** 31
+_INT_MAX = 2 ** 31 - 1
+
+
+class Encoder(object):
+    """
+    Writes top level code elements as records of the serialization format.
+    The constant and layout tables are shared by all the records written by
+    one encoder, so they must be read by a single decoder, in order.
+    """
+
+    def __init__(self, stream, compress=False):
+        """
+        Writes the header of the format.
+
+        :param stream: The stream to write to. Must accept ``str``.
+        :param compress: Whether to compress the records. Compressed trees
+            are typically a few percent of the uncompressed size.
+        :type compress: bool
+        """
+        self._stream = stream
+        self._compress = compress
+        self._constants = {}
+        self._layouts = {}
+        stream.write(_HEADER.pack(MAGIC, VERSION,
+                                  COMPRESSED if compress else 0))
+
+    def write(self, element):
+        """
+        Writes a top level code element and its descendants as one record.
+
+        :type element: CodeElement
+        """
+        constants = self._constants
+        layouts = self._layouts
+        new_constants = []
+        new_layouts = []
+        references = {}
+        ops = array("i")
+        append = ops.append
+        stack = [element]
+        push = stack.append
+        pop = stack.pop
+        extend = stack.extend
+        while stack:
+            value = pop()
+            value_class = value.__class__
+            if value_class in _CONSTANTS or (
+                    value_class is int and
+                    not _INT_MIN <= value <= _INT_MAX):
+                # Floats are told apart by their repr, since 0.0 == -0.0.
+                key = (value_class,
+                       repr(value) if value_class is float else value)
+                index = constants.get(key)
+                if index is None:
+                    index = constants[key] = len(constants)
+                    new_constants.append(value)
+                append(CONSTANT)
+                append(index)
+            elif value is None:
+                append(NONE)
+            elif value is True:
+                append(TRUE)
+            elif value is False:
+                append(FALSE)
+            elif value_class is int:
+                append(INT)
+                append(value)
+            elif value_class in _CONTAINERS:
+                append(_CONTAINERS[value_class])
+                append(len(value))
+                extend(reversed(tuple(value)))
+            elif value_class is dict:
+                append(DICT)
+                append(len(value))
+                extend(reversed([item for pair in value.iteritems()
+                                 for item in pair]))
+            elif isinstance(value, CodeElement):
+                index = references.get(id(value))
+                if index is not None:
+                    append(REFERENCE)
+                    append(index)
+                    continue
+                references[id(value)] = len(references)
+                state = value.__getstate__()
+                names = tuple(state)
+                key = (value_class, names)
+                index = layouts.get(key)
+                if index is None:
+                    index = layouts[key] = len(layouts)
+                    new_layouts.append((value_class.__module__,
+                                        value_class.__name__, names))
+                append(ELEMENT)
+                append(index)
+                extend(reversed(state.values()))
+            else:
+                raise TypeError("Cannot serialize %r" % (value,))
+
+        record = marshal.dumps((tuple(new_constants), tuple(new_layouts),
+                                ops.tostring()))
+        if self._compress:
+            record = zlib.compress(record, 1)
+        self._stream.write(_LENGTH.pack(len(record)))
+        self._stream.write(record)
+
+
+class Decoder(object):
+    """
+    Reads the top level code elements written by an ``Encoder``.
+    Only code element types can be created by decoding, but the modules of
+    the types are imported, so only trusted data should be decoded.
+    """
+
+    def __init__(self, stream):
+        """
+        Reads and checks the header of the format.
+
+        :param stream: The stream to read from.
+        :raises ValueError: If the stream does not start with the header of
+            a supported version of the format.
+        """
+        self._stream = stream
+        self._constants = []
+        self._layouts = []
+        header = stream.read(_HEADER.size)
+        if len(header) != _HEADER.size or header[:len(MAGIC)] != MAGIC:
+            raise ValueError("Not a serialized element tree")
+        _, version, flags = _HEADER.unpack(header)
+        if version != VERSION:
+            raise ValueError("Unsupported serialization version %d" %
+                             (version,))
+        self._compressed = bool(flags & COMPRESSED)
+
+    def __iter__(self):
+        """
+        Reads the top level elements one by one, as they are iterated.
+        """
+        while True:
+            prefix = self._stream.read(_LENGTH.size)
+            if not prefix:
+                return
+            length, = _LENGTH.unpack(prefix)
+            record = self._stream.read(length)
+            if len(record) != length:
+                raise ValueError("Truncated serialized element tree")
+            if self._compressed:
+                record = zlib.decompress(record)
+            new_constants, new_layouts, ops = marshal.loads(record)
+            self._constants.extend(new_constants)
+            self._layouts.extend((_load_type(module, name), names)
+                                 for module, name, names in new_layouts)
+            yield self._decode(array("i", ops))
+
+    def _decode(self, ops):
+        constants = self._constants
+        layouts = self._layouts
+        references = []
+        # Every frame is a list of the operation of a container, the values
+        # read so far, the number of values still missing, and the layout
+        # and the instance of the element being decoded.
+        stack = []
+        value = None
+        position = 0
+        end = len(ops)
+        while position < end:
+            op = ops[position]
+            operand = ops[position + 1] if op > FALSE else None
+            position += 1 if operand is None else 2
+            if op == CONSTANT:
+                value = constants[operand]
+            elif op == ELEMENT:
+                layout = layouts[operand]
+                element_class = layout[0]
+                element = element_class.__new__(element_class)
+                references.append(element)
+                if layout[1]:
+                    stack.append([op, [], len(layout[1]), layout, element])
+                    continue
+                value = _build(op, (), layout, element)
+            elif op == INT:
+                value = operand
+            elif op == REFERENCE:
+                value = references[operand]
+            elif op <= FALSE:
+                value = (None, True, False)[op]
+            else:
+                size = operand * 2 if op == DICT else operand
+                if size:
+                    stack.append([op, [], size, None, None])
+                    continue
+                value = _build(op, [], None, None)
+
+            # Completes the frames that the value was the last item of.
+            while stack:
+                frame = stack[-1]
+                frame[1].append(value)
+                frame[2] -= 1
+                if frame[2]:
+                    break
+                stack.pop()
+                value = _build(frame[0], frame[1], frame[3], frame[4])
+        return value
+
+
+def _build(op, items, layout, element):
+    if op == ELEMENT:
+        element.__setstate__(dict(zip(layout[1], items)))
+        _adopt_children(element, items)
+        return element
+    if op == TUPLE:
+        return tuple(items)
+    if op == LIST:
+        return items
+    if op == DICT:
+        return dict(zip(items[::2], items[1::2]))
+    if op == SET:
+        return set(items)
+    return frozenset(items)
+
+
+def _adopt_children(element, values):
+    for value in values:
+        if isinstance(value, CodeElement):
+            if value._parent is None and not value.SHARED:
+                value._parent = element
+        elif isinstance(value, (tuple, list)):
+            _adopt_children(element, value)
+
+
+def _load_type(module, name):
+    element_class = getattr(importlib.import_module(module), name, None)
+    if not (isinstance(element_class, type) and
+            issubclass(element_class, CodeElement)):
+        raise ValueError("%s.%s is not a code element type" % (module, name))
+    return element_class
+
+
+def dump(elements, stream, compress=False):
+    """
+    Serializes top level code elements into a stream, one at a time.
+
+    :param elements: An iterable of code elements, such as a generator.
+    :param stream: The stream to write to.
+    :param compress: Whether to compress the records.
+    :type compress: bool
+    """
+    encoder = Encoder(stream, compress)
+    for element in elements:
+        encoder.write(element)
+
+
+def load(stream):
+    """
+    Deserializes top level code elements from a stream lazily. The result
+    can be added to a source file with ``add_elements``, to emit the
+    elements while they are read.
+
+    :param stream: The stream to read from.
+    :return: An iterator over the code elements.
+    """
+    return iter(Decoder(stream))
+
+
+def dumps(elements, compress=False):
+    """
+    Serializes top level code elements into a string.
+
+    :param elements: An iterable of code elements.
+    :param compress: Whether to compress the records.
+    :type compress: bool
+    :rtype: str
+    """
+    stream = StringIO()
+    dump(elements, stream, compress)
+    return stream.getvalue()
+
+
+def loads(data):
+    """
+    Deserializes all the top level code elements in a string.
+
+    :param data: A string returned by ``dumps``.
+    :type data: str
+    :rtype: list[CodeElement]
+    """
+    return list(load(StringIO(data)))
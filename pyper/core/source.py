@@ -1,6 +1,36 @@
 from io import FileIO
 import os
 
+from pyper.core.lazy import LazyElements, iter_elements
+
+
+class _FragmentList(list):
+    """
+    A list that can be used as a stream, collecting the written fragments.
+    """
+    write = list.append
+
+
+def _render_task(task):
+    """
+    Renders a code element in a worker of ``SourceFile.emit_concurrent``.
+
+    :param task: The layout to render at, whether the element starts a new
+        line, and the element.
+    :return: A ``(text, is_new_line)`` pair, as returned by
+        ``SourceFile.render``.
+    """
+    (fork_class, indentation, line_separator, level), is_new_line, element = \
+        task
+    fragments = _FragmentList()
+    source_file = fork_class(fragments, indentation=indentation,
+                             line_separator=line_separator)
+    source_file.indent(level)
+    source_file._is_new_line = is_new_line
+    source_file.emit_element(element)
+    source_file.flush()
+    return "".join(fragments), source_file.is_new_line()
+
 
 class IndentedContext(object):
     """
@@ -23,7 +53,11 @@ class SourceFile(object):
     TWO_SPACES = WHITESPACE * 2
     TAB = "\t"
 
-    def __init__(self, stream, indentation=TAB, line_separator=os.linesep):
+    DEFAULT_CHUNK_SIZE = 64 * 1024
+    DEFAULT_MIN_SIBLINGS = 16
+
+    def __init__(self, stream, indentation=TAB, line_separator=os.linesep,
+                 buffer_size=None):
         """
         Initializes a new source file.
 
@@ -33,13 +67,42 @@ class SourceFile(object):
         :type indentation: str
         :param line_separator: The line separator for this file.
         :type line_separator: str
+        :param buffer_size: If given, written text is collected in memory and
+            written to the stream in one block whenever a line ends with at
+            least ``buffer_size`` fragments pending, and at the end of
+            ``emit``. If ``None``, every fragment is written to the stream
+            directly.
+        :type buffer_size: int
         """
         self._stream = stream
         self._indentation = indentation
         self._line_separator = line_separator
         self._indentation_level = 0
+        self._indentation_prefix = ""
         self._is_new_line = True
+        self._incremental = False
+        self._executor = None
+        self._min_siblings = None
         self._elements = []
+        self._buffer = []
+        self._buffer_size = buffer_size
+        self._put = (stream.write if buffer_size is None
+                     else self._buffer.append)
+
+    def set_profiler(self, profiler):
+        """
+        Records every element emitted through ``emit_element`` from now on
+        with the given profiler.
+        Forks of this source file are not profiled, so elements rendered
+        through them are recorded as a whole.
+
+        :param profiler: The profiler.
+        :type profiler: pyper.core.instrumentation.EmissionProfiler
+        :return: self
+        """
+        self._put = profiler.wrap_put(self._put, self._line_separator)
+        self.emit_element = profiler.wrap_emit_element(self.emit_element)
+        return self
 
     def indent(self, levels=1):
         """
@@ -49,6 +112,7 @@ class SourceFile(object):
         :return: self
         """
         self._indentation_level += levels
+        self._indentation_prefix = self._indentation * self._indentation_level
         return self
 
     def dedent(self, levels=1):
@@ -59,8 +123,57 @@ class SourceFile(object):
         :return: self.
         """
         self._indentation_level = max(self._indentation_level - levels, 0)
+        self._indentation_prefix = self._indentation * self._indentation_level
         return self
 
+    def layout(self):
+        """
+        Returns everything that affects how an element is rendered at the
+        current position of this file: The indentation unit, the indentation
+        level, the line separator, and whether a new line was just started.
+
+        :rtype: tuple
+        """
+        return (self._indentation, self._indentation_level,
+                self._line_separator, self._is_new_line)
+
+    def fork(self, stream, **kwargs):
+        """
+        Creates a new, empty source file writing to ``stream``, with the same
+        indentation, line separator and current position as this one.
+
+        :param stream: The stream of the new source file.
+        :param kwargs: Extra arguments for the new source file.
+        :return: The new source file.
+        :rtype: SourceFile
+        """
+        source_file = self._new_fork(stream, **kwargs)
+        source_file.indent(self._indentation_level)
+        source_file._is_new_line = self._is_new_line
+        source_file._incremental = self._incremental
+        return source_file
+
+    def _new_fork(self, stream, **kwargs):
+        return self.__class__(stream, indentation=self._indentation,
+                              line_separator=self._line_separator, **kwargs)
+
+    def render(self, element):
+        """
+        Renders an element exactly as it would be emitted at the current
+        position of this file, without writing anything to it.
+
+        :param element: The code element to render.
+        :type element: pyper.core.code.CodeElement
+        :return: A ``(text, is_new_line)`` pair, that can be replayed using
+            ``write_rendered``.
+        :rtype: tuple
+        """
+        fragments = _FragmentList()
+        source_file = self.fork(fragments)
+        element.emit(source_file)
+        source_file.flush()
+        return "".join(fragments), source_file.is_new_line()
+
     def indented_block(self):
         return IndentedContext(self)
 
@@ -75,6 +188,19 @@ class SourceFile(object):
         self._elements.append(code_element)
         return self
 
+    def add_elements(self, code_elements):
+        """
+        Adds code elements to the source file, without consuming them.
+        The elements are pulled from ``code_elements`` only while the file
+        is emitted, and are not kept, so they can be emitted only once.
+
+        :param code_elements: An iterable of code elements, such as a
+            generator.
+        :return: self
+        """
+        self._elements.append(LazyElements(code_elements))
+        return self
+
     def write(self, text, *args):
         """
         Writes a text at the current indentation level.
@@ -86,10 +212,42 @@ class SourceFile(object):
         if not text:
             return self
 
+        text = text % args
         if self._is_new_line:
-            self._stream.write(self._indentation * self._indentation_level)
+            text = self._indentation_prefix + text
             self._is_new_line = False
-        self._stream.write(text % args)
+        self._put(text)
+        return self
+
+    def write_lines(self, lines):
+        """
+        Writes lines of text at the current indentation level, with a line
+        feed between every two lines but not after the last one.
+        Produces the same code as writing the lines one by one, but writes
+        all of them at once. The lines are written as is, and are not
+        formatted.
+
+        :param lines: A list of lines, without line separators.
+        :type lines: list[str]
+        :return: self
+        """
+        if not lines:
+            return self
+
+        prefix = self._indentation_prefix
+        first = lines[0]
+        if first and self._is_new_line:
+            first = prefix + first
+        if len(lines) == 1:
+            if first:
+                self._put(first)
+                self._is_new_line = False
+            return self
+
+        rest = [prefix + line if line else line for line in lines[1:]]
+        rest.insert(0, first)
+        self._put(self._line_separator.join(rest))
+        self._is_new_line = not rest[-1]
         return self
 
     def write_line(self, line):
@@ -107,19 +265,241 @@ class SourceFile(object):
 
         :return: self.
         """
-        self._stream.write(self._line_separator)
+        self._put(self._line_separator)
         self._is_new_line = True
+        if (self._buffer_size is not None and
+                len(self._buffer) >= self._buffer_size):
+            self.flush()
+        return self
+
+    def write_rendered(self, text, is_new_line):
+        """
+        Writes text previously produced by ``render`` verbatim.
+        The text must have been rendered with the current ``layout`` of this
+        file.
+
+        :param text: The rendered text.
+        :param is_new_line: Whether the rendered text ends a line.
+        :return: self.
+        """
+        if text:
+            self._put(text)
+            self._is_new_line = is_new_line
+        return self
+
+    def flush(self):
+        """
+        Writes any buffered text to the underlying stream.
+        Does nothing if the source file is not buffered.
+
+        :return: self.
+        """
+        if self._buffer:
+            self._stream.write("".join(self._buffer))
+            del self._buffer[:]
         return self
 
     def emit(self):
-        for element in self._elements:
-            element.emit(self)
+        self.emit_elements(iter_elements(self._elements))
+        self.flush()
+
+    def emit_concurrent(self, executor, min_siblings=DEFAULT_MIN_SIBLINGS):
+        """
+        Emits all the elements like ``emit``, rendering sibling elements
+        concurrently.
+
+        The first sequence of siblings emitted through ``emit_elements``
+        with at least ``min_siblings`` elements, such as the top level
+        elements or the methods of a single huge class, is rendered by the
+        executor, every element into its own buffer at the indentation
+        level it starts at. The buffers are written in order, so the code is
+        identical to the code of ``emit``. Elements are rendered as if they
+        start a new line; An element that follows an element ending in the
+        middle of a line is rendered again.
+
+        Incremental emission and profiling do not apply to the siblings
+        rendered concurrently.
+
+        :param executor: A thread pool, a process pool, or any other object
+            with a ``map`` method that preserves the order of the results.
+            With a process pool, the elements must be picklable.
+        :param min_siblings: The minimal number of siblings worth rendering
+            concurrently. Smaller sequences are emitted in order, and their
+            elements may render their own children concurrently.
+        :type min_siblings: int
+        """
+        self._executor = executor
+        self._min_siblings = min_siblings
+        try:
+            self.emit()
+        finally:
+            self._executor = None
+
+    def emit_elements(self, elements):
+        """
+        Emits sibling elements one after the other. During
+        ``emit_concurrent``, the siblings may be rendered concurrently.
+
+        :param elements: An iterable of code elements.
+        :return: self
+        """
+        executor = self._executor
+        if executor is not None:
+            elements = list(elements)
+            if len(elements) >= self._min_siblings:
+                # Children of the siblings are rendered serially, in the
+                # forks of the workers.
+                self._executor = None
+                try:
+                    self._emit_siblings(elements, executor)
+                finally:
+                    self._executor = executor
+                return self
+
+        for element in elements:
+            self.emit_element(element)
+        return self
+
+    def _emit_siblings(self, elements, executor):
+        fork_class = self._new_fork(_FragmentList()).__class__
+        layout = (fork_class, self._indentation, self._line_separator,
+                  self._indentation_level)
+        starts = [self._is_new_line] + [True] * (len(elements) - 1)
+        tasks = [(layout, is_new_line, element)
+                 for is_new_line, element in zip(starts, elements)]
+        results = executor.map(_render_task, tasks)
+        for start, element, (text, is_new_line) in zip(starts, elements,
+                                                       results):
+            if start != self._is_new_line:
+                text, is_new_line = self.render(element)
+            self.write_rendered(text, is_new_line)
+
+    def emit_incremental(self):
+        """
+        Emits all the elements like ``emit``, but renders again only the
+        cacheable elements that changed since they were last emitted
+        incrementally. The output of all the other cacheable elements is
+        written from their cache.
+        """
+        self._incremental = True
+        try:
+            self.emit()
+        finally:
+            self._incremental = False
+
+    def iter_emit(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Emits all the elements lazily. Instead of writing the code to the
+        stream, yields it in chunks while the element tree is walked, so
+        the whole output is never held in memory.
+
+        :param chunk_size: The minimal length of every chunk but the last.
+        :type chunk_size: int
+        :return: An iterator over the chunks of the code.
+        """
+        return self.iter_emit_elements(iter_elements(self._elements),
+                                       chunk_size)
+
+    def iter_emit_elements(self, elements, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Emits the given elements lazily, like ``iter_emit``.
+        The elements are emitted using their ``emit_steps``, so the output is
+        yielded between the steps.
+
+        :param elements: The code elements to emit.
+        :param chunk_size: The minimal length of every chunk but the last.
+        :type chunk_size: int
+        :return: An iterator over the chunks of the code.
+        """
+        # Buffered text was written before the elements, so it is due on
+        # the stream before their first chunk.
+        self.flush()
+        put = self._put
+        fragments = []
+        self._put = fragments.append
+        try:
+            chunk = []
+            size = 0
+            for _ in self._steps(elements):
+                if fragments:
+                    text = "".join(fragments)
+                    del fragments[:]
+                    chunk.append(text)
+                    size += len(text)
+                    if size >= chunk_size:
+                        yield "".join(chunk)
+                        del chunk[:]
+                        size = 0
+            if chunk:
+                yield "".join(chunk)
+        finally:
+            self._put = put
+
+    def emit_iterative(self):
+        """
+        Emits all the elements like ``emit``, but walks the element tree
+        using the elements' ``emit_steps`` and an explicit stack instead of
+        recursion. Trees of any depth can be emitted this way.
+        """
+        for _ in self._steps(iter_elements(self._elements)):
+            pass
+        self.flush()
+
+    def _steps(self, elements):
+        """
+        Emits the given elements and their descendants using their
+        ``emit_steps``, yielding after every step.
+        """
+        stack = [iter(elements)]
+        while stack:
+            for element in stack[-1]:
+                if element is not None:
+                    stack.append(iter(element.emit_steps(self)))
+                break
+            else:
+                stack.pop()
+            yield
+
+    def emit_async(self, chunk_size=DEFAULT_CHUNK_SIZE, drain=None):
+        """
+        Emits all the elements cooperatively, as a generator based coroutine
+        for event loops such as tornado's ``gen.coroutine`` or twisted's
+        ``inlineCallbacks``.
+
+        The code is written to the stream in chunks, like ``iter_emit``
+        produces them. After every chunk the coroutine yields the result of
+        the stream's ``write``, or of ``drain()`` if given, so the loop can
+        run other tasks and resume the emission only when the stream is
+        ready for more.
+
+        :param chunk_size: The minimal length of every chunk but the last.
+        :type chunk_size: int
+        :param drain: A callable returning an object to wait for after every
+            chunk, such as a future resolved once the stream was drained.
+        :return: A generator yielding once per chunk.
+        """
+        self.flush()
+        for chunk in self.iter_emit(chunk_size):
+            result = self._stream.write(chunk)
+            yield result if drain is None else drain()
 
     def emit_element(self, element):
         if element is not None:
-            element.emit(self)
+            if self._incremental and element.CACHEABLE:
+                self._emit_cached(element)
+            else:
+                element.emit(self)
         return self
 
+    def _emit_cached(self, element):
+        layout = self.layout()
+        rendered = element._rendered
+        if element._dirty or rendered is None or rendered[0] != layout:
+            text, is_new_line = self.render(element)
+            rendered = element._rendered = (layout, text, is_new_line)
+            element._dirty = False
+        self.write_rendered(rendered[1], rendered[2])
+
     def emit_indented(self, element):
         if element is not None:
             with self.indented_block():
@@ -128,3 +508,203 @@ class SourceFile(object):
 
     def is_new_line(self):
         return self._is_new_line
+
+    def indentation_width(self):
+        """
+        Returns the number of columns taken by the current indentation, with
+        tabs expanded to the next multiple of 8.
+
+        :rtype: int
+        """
+        return len(self._indentation_prefix.expandtabs())
+
+
+class _Targets(object):
+    """
+    A stream that writes the code of a ``MultiTargetSourceFile`` to all of
+    its targets, with their own indentation and line separator.
+    """
+
+    def __init__(self, targets, indentation, line_separator):
+        self._indentation = indentation
+        self._line_separator = line_separator
+        # Targets with the same indentation and line separator share the
+        # translated text.
+        flavours = {}
+        for stream, target_indentation, target_line_separator in targets:
+            flavours.setdefault(
+                (target_indentation, target_line_separator), []).append(
+                stream.write)
+        self._flavours = flavours.items()
+
+    def write(self, text):
+        for (indentation, line_separator), writers in self._flavours:
+            translated = text.replace(self._indentation, indentation)\
+                .replace(self._line_separator, line_separator)
+            for write in writers:
+                write(translated)
+
+
+class MultiTargetSourceFile(SourceFile):
+    """
+    A source file that emits the same code into several streams, each with
+    its own indentation and line separator, walking the element tree once.
+
+    The code is emitted with placeholder control characters as the
+    indentation unit and the line separator, buffered, and translated to
+    the indentation and line separator of every target whenever the buffer
+    is written. The emitted code must not contain the placeholders.
+
+    The indentation placeholder is as wide as the widest indentation unit of
+    the targets, so elements that fit their code to the width of the
+    indentation, like ``CollectionLiteral``, fit it to every target. Their
+    code in narrower targets may be wrapped earlier than it would be when
+    emitted into the target alone.
+
+    ``iter_emit`` yields the code with the placeholders.
+    """
+
+    INDENTATION = "\x1f"
+    LINE_SEPARATOR = "\x1e"
+
+    DEFAULT_BUFFER_SIZE = 4096
+
+    def __init__(self, targets, buffer_size=DEFAULT_BUFFER_SIZE):
+        """
+        Initializes a new multi target source file.
+
+        :param targets: ``(stream, indentation, line_separator)`` tuples,
+            one for every stream to write the code into.
+        :param buffer_size: The number of fragments to collect before they
+            are translated and written to the targets, as in ``SourceFile``.
+        :type buffer_size: int
+        """
+        targets = list(targets)
+        width = max([len(indentation.expandtabs())
+                     for _, indentation, _ in targets] or [1])
+        indentation = self.INDENTATION * max(width, 1)
+        SourceFile.__init__(self,
+                            _Targets(targets, indentation,
+                                     self.LINE_SEPARATOR),
+                            indentation=indentation,
+                            line_separator=self.LINE_SEPARATOR,
+                            buffer_size=buffer_size)
+
+    def _new_fork(self, stream, **kwargs):
+        # Forks render text with the placeholders, which is translated when
+        # it is written back to this file.
+        return SourceFile(stream, indentation=self._indentation,
+                          line_separator=self._line_separator, **kwargs)
+
+
+class BinarySourceFile(SourceFile):
+    """
+    A source file that encodes its output as it is written, and collects it
+    in a ``bytearray`` that is written to a raw file in large blocks.
+    """
+
+    DEFAULT_ENCODING = "utf-8"
+    DEFAULT_BLOCK_SIZE = 1024 * 1024
+
+    def __init__(self, stream, indentation=SourceFile.TAB,
+                 line_separator=os.linesep, encoding=DEFAULT_ENCODING,
+                 block_size=DEFAULT_BLOCK_SIZE, buffer_size=None):
+        """
+        Initializes a new binary source file.
+
+        :param stream: A raw binary stream, such as a ``FileIO``, or a file
+            descriptor.
+        :param indentation: The indentation string of one indentation unit.
+        :type indentation: str
+        :param line_separator: The line separator for this file.
+        :type line_separator: str
+        :param encoding: The encoding of the written text.
+        :type encoding: str
+        :param block_size: The number of bytes to collect before writing them
+            to the stream.
+        :type block_size: int
+        :param buffer_size: Accepted like in ``SourceFile``, so both types
+            take the same arguments, as in ``OutputFile``. Binary source
+            files are always buffered in blocks of ``block_size`` bytes, so
+            it is ignored.
+        :type buffer_size: int
+        """
+        self._encoding = encoding
+        SourceFile.__init__(self, stream,
+                            indentation=self._encode(indentation),
+                            line_separator=self._encode(line_separator),
+                            buffer_size=block_size)
+        self._buffer = bytearray()
+        self._put = self._buffer.__iadd__
+
+    @classmethod
+    def open(cls, path, **kwargs):
+        """
+        Creates a binary source file writing to a new file.
+
+        :param path: The path of the file.
+        :param kwargs: Extra arguments for the source file.
+        :rtype: BinarySourceFile
+        """
+        return cls(FileIO(path, "w"), **kwargs)
+
+    def _encode(self, text):
+        if isinstance(text, unicode):
+            return text.encode(self._encoding)
+        return text
+
+    def write(self, text, *args):
+        if not text:
+            return self
+
+        text = text % args
+        if self._is_new_line:
+            text = self._indentation_prefix + text
+            self._is_new_line = False
+        try:
+            self._put(text)
+        except TypeError:
+            self._put(text.encode(self._encoding))
+        return self
+
+    def write_rendered(self, text, is_new_line):
+        return SourceFile.write_rendered(self, self._encode(text),
+                                         is_new_line)
+
+    def write_lines(self, lines):
+        return SourceFile.write_lines(self, [self._encode(line)
+                                             for line in lines])
+
+    def _new_fork(self, stream, **kwargs):
+        # Forks are used to render text, which is encoded when it is written
+        # back to this file.
+        return SourceFile(stream, indentation=self._indentation,
+                          line_separator=self._line_separator, **kwargs)
+
+    def flush(self):
+        """
+        Writes the collected bytes to the stream, without copying them.
+
+        :return: self.
+        """
+        data = memoryview(self._buffer)
+        offset = 0
+        while offset < len(data):
+            if isinstance(self._stream, int):
+                offset += os.write(self._stream, data[offset:])
+            else:
+                written = self._stream.write(data[offset:])
+                offset = len(data) if written is None else offset + written
+        del data
+        del self._buffer[:]
+        return self
+
+    def close(self):
+        """
+        Flushes the collected bytes and closes the stream.
+        """
+        self.flush()
+        if isinstance(self._stream, int):
+            os.close(self._stream)
+        else:
+            self._stream.close()
@@ -0,0 +1,152 @@
+from pyper.core.code import CodeElement
+
+
+class Slot(str):
+    """
+    A placeholder for a value that is given only when a template is filled.
+    A slot is a string, so it can be used anywhere code elements take a
+    string: As a name, a parent class, a parameter, a default value, or the
+    text of a ``TextCodeElement``.
+    """
+
+    MARKER = "\0"
+
+    def __new__(cls, name):
+        """
+        Creates a new slot.
+
+        :param name: The name of the slot. Must not contain ``MARKER``.
+        :type name: str
+        """
+        slot = str.__new__(cls, "%s%s%s" % (cls.MARKER, name, cls.MARKER))
+        slot.name = name
+        return slot
+
+
+class Template(object):
+    """
+    A code element tree containing slots, compiled into a format string.
+    Filling the template with values produces the same code as emitting the
+    tree with the values in place of the slots, without walking the tree
+    again.
+
+    The values are written as is, so they must not contain line breaks: The
+    lines after the first would not be indented like the emitted tree
+    indents them.
+    """
+
+    def __init__(self, element, source_file):
+        """
+        Compiles a template.
+        The template can be emitted only where the layout of a source file
+        is the same as the current layout of ``source_file``.
+
+        :param element: The code element tree to compile.
+        :type element: CodeElement
+        :param source_file: The source file to render the tree with.
+        :type source_file: pyper.core.source.SourceFile
+        """
+        text, self._is_new_line = source_file.render(element)
+        self._layout = source_file.layout()
+        parts = text.split(Slot.MARKER)
+        self.slot_names = []
+        fields = []
+        for name in parts[1::2]:
+            if name not in self.slot_names:
+                self.slot_names.append(name)
+            fields.append("{%d}" % (self.slot_names.index(name),))
+        fields.append("")
+        literals = (part.replace("{", "{{").replace("}", "}}")
+                    for part in parts[0::2])
+        self._format = "".join(literal + field
+                               for literal, field in zip(literals, fields))
+
+    def format(self, values):
+        """
+        Fills the template.
+
+        :param values: The values of the slots, in the order of
+            ``slot_names``.
+        :type values: tuple
+        :return: The code.
+        :rtype: str
+        :raises ValueError: If a value contains a line break.
+        """
+        _check_values(values)
+        return self._format.format(*values)
+
+    def emit(self, source_file, values):
+        """
+        Fills the template, and writes the code to the source file.
+
+        :param source_file: The source file.
+        :type source_file: pyper.core.source.SourceFile
+        :param values: The values of the slots, in the order of
+            ``slot_names``.
+        :type values: tuple
+        :raises ValueError: If a value contains a line break.
+        """
+        self._check_layout(source_file)
+        source_file.write_rendered(self.format(values), self._is_new_line)
+
+    def emit_all(self, source_file, rows):
+        """
+        Fills the template once per row, and writes the code to the source
+        file. The code of each row must end where the code of the next one
+        can start, at the same layout.
+
+        :param source_file: The source file.
+        :type source_file: pyper.core.source.SourceFile
+        :param rows: An iterable of slot value tuples.
+        :raises ValueError: If a value contains a line break.
+        """
+        self._check_layout(source_file)
+        if self._is_new_line != self._layout[-1]:
+            raise ValueError("Template output does not end at the layout it "
+                             "starts at")
+        format_code = self._format.format
+        write_rendered = source_file.write_rendered
+        is_new_line = self._is_new_line
+        for values in rows:
+            _check_values(values)
+            write_rendered(format_code(*values), is_new_line)
+
+    def instance(self, values):
+        """
+        Returns a code element emitting this template filled with
+        ``values``.
+
+        :rtype: TemplateInstance
+        """
+        return TemplateInstance(self, values)
+
+    def _check_layout(self, source_file):
+        if source_file.layout() != self._layout:
+            raise ValueError("Template was compiled for a different layout")
+
+
+def _check_values(values):
+    for value in values:
+        if isinstance(value, basestring) and ("\n" in value or
+                                              "\r" in value):
+            raise ValueError("Template slot value %r contains a line break" %
+                             (value,))
+
+
+class TemplateInstance(CodeElement):
+    """
+    A template filled with values.
+    """
+
+    __slots__ = ("template", "values")
+
+    def __init__(self, template, values):
+        self.template = template
+        self.values = values
+
+    def fields(self):
+        return (self.template._format, self.template._is_new_line,
+                tuple(self.values))
+
+    def emit(self, source_file):
+        self.template.emit(source_file, self.values)
@@ -0,0 +1,488 @@
+import ast
+import copy
+import re
+from StringIO import StringIO
+
+from pyper.core.cache import FragmentCache
+from pyper.core.code import TextCodeElement, strict_key
+from pyper.lang.python.code import Class, FunctionDeclaration, Decorator, \
+    IfStatement, ElifStatement, WhileStatement, Pass, Literal, BytesLiteral, \
+    CollectionLiteral, DictLiteral, ListLiteral, TupleLiteral, SetLiteral
+from pyper.lang.python.source import PythonSourceFile
+
+_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*\Z")
+_CONSTANTS = ("None", "True", "False")
+_LOAD = ast.Load()
+_PARAM = ast.Param()
+
+
+def _node(node_class, **fields):
+    # Expressions are placed on the first line, like ``compile`` does for
+    # nodes without a location, but without walking the whole tree. The
+    # compiler takes line numbers from expressions only when they are after
+    # the line of their statement, so this does not affect tracebacks.
+    return _statement(node_class, 1, **fields)
+
+
+def _statement(node_class, lineno, **fields):
+    node = node_class(**fields)
+    node.lineno = lineno
+    node.col_offset = 0
+    return node
+
+
+class AstBackend(object):
+    """
+    Lowers code element trees directly into ``ast`` nodes, that can be passed
+    to ``compile`` without emitting and parsing the code.
+
+    The Python code elements are lowered node by node. Any other element,
+    such as a ``TextCodeElement``, is emitted on its own and its code is
+    parsed as a fragment, so every element that emits valid code can be
+    lowered. Subclasses of the Python code elements are lowered as their
+    base class, unless a lowering is registered for them.
+
+    Elements are described through ``CodeElement.fields``, and containers
+    through ``ContainerCodeElement.header_fields`` and
+    ``ContainerCodeElement.iter_body``, so lazily added body elements are
+    consumed.
+
+    Parsing a fragment is much slower than building its nodes, so parsed
+    fragments are cached by their code, and literals and parameters by their
+    values. The nodes of equal fragments, literals and parameters are shared
+    within a tree and between the trees lowered by one backend, so a lowered
+    tree must not be transformed in place; Copy it with ``copy.deepcopy``
+    first.
+
+    Statements are numbered like the lines of the emitted code, as long as
+    the items of every collection literal fit in one line. A literal whose
+    items are wrapped over several lines shifts the statements after it,
+    within the same module.
+
+    On CPython 2, ``compile`` converts every node of the tree back into its
+    internal representation, which takes a little longer than parsing the
+    emitted code. Lowering is therefore at best about as fast as emitting and
+    compiling the code, and cannot be several times faster.
+    """
+
+    def __init__(self, fragment_cache=None):
+        """
+        :param fragment_cache: The cache of parsed fragments. Defaults to a
+            new cache.
+        :type fragment_cache: pyper.core.cache.FragmentCache
+        """
+        self._statements = dict(self._STATEMENTS)
+        self._expressions = dict(self._EXPRESSIONS)
+        self._fragments = (fragment_cache if fragment_cache is not None
+                           else FragmentCache())
+        self._line = 1
+
+    def register_statement(self, element_class, lowering):
+        """
+        Registers how to lower elements of a type as statements.
+
+        :param element_class: The type of code elements.
+        :param lowering: A function of the backend and an element, returning
+            a list of ``ast.stmt`` nodes. It should number the nodes with
+            ``new_lines``, before lowering their children.
+        :return: self
+        """
+        self._statements[element_class] = lowering
+        return self
+
+    def register_expression(self, element_class, lowering):
+        """
+        Registers how to lower elements of a type as expressions.
+
+        :param element_class: The type of code elements.
+        :param lowering: A function of the backend and an element, returning
+            an ``ast.expr`` node.
+        :return: self
+        """
+        self._expressions[element_class] = lowering
+        return self
+
+    def module(self, elements):
+        """
+        Lowers top level code elements into a module.
+
+        :param elements: An iterable of code elements.
+        :rtype: ast.Module
+        """
+        # The lines are numbered by a copy of the backend, so a backend can
+        # lower many modules at once.
+        backend = copy.copy(self)
+        backend._line = 1
+        return ast.Module(body=backend.statements(elements))
+
+    def compile(self, elements, filename="<pyper>"):
+        """
+        Lowers top level code elements and compiles them.
+
+        :param elements: An iterable of code elements.
+        :param filename: The file name that tracebacks show.
+        :type filename: str
+        :return: A code object, as returned by ``compile``.
+        """
+        return compile(self.module(elements), filename, "exec")
+
+    def statements(self, elements):
+        """
+        Lowers code elements as a block of statements.
+
+        :param elements: An iterable of code elements.
+        :return: A list of ``ast.stmt`` nodes.
+        """
+        nodes = []
+        for element in elements:
+            nodes.extend(self.statement(element))
+        return nodes
+
+    def statement(self, element):
+        """
+        Lowers a code element as statements.
+
+        :return: A list of ``ast.stmt`` nodes.
+        """
+        lowering = _lookup(self._statements, element)
+        if lowering is None:
+            if _lookup(self._expressions, element) is None:
+                return self.parse_statements(element)
+            # An expression statement, such as a literal in a body.
+            return [_statement(ast.Expr, self.new_lines(),
+                               value=self.expression(element))]
+        return lowering(self, element)
+
+    def new_lines(self, count=1):
+        """
+        Returns the line number of the next statement, and moves past
+        ``count`` lines.
+
+        :type count: int
+        :rtype: int
+        """
+        line = self._line
+        self._line += count
+        return line
+
+    def expression(self, element):
+        """
+        Lowers a code element as an expression.
+
+        :rtype: ast.expr
+        """
+        lowering = _lookup(self._expressions, element)
+        if lowering is None:
+            return self.parse_expression(_render(element))
+        if not isinstance(element, _LITERALS):
+            return lowering(self, element)
+        if isinstance(element, CollectionLiteral) and element.fields()[0]:
+            # The lines of the opening and closing brackets.
+            self.new_lines(2)
+
+        try:
+            key = (element.__class__, strict_key(element.fields(), None))
+            node = self._fragments.get(key)
+        except (TypeError, NotImplementedError):
+            return lowering(self, element)
+        if node is None:
+            node = lowering(self, element)
+            self._fragments.put(key, node)
+        return node
+
+    def parse_statements(self, element):
+        """
+        Emits a code element, and parses its code as statements.
+
+        :return: A list of ``ast.stmt`` nodes.
+        """
+        return self._parse_statements(_render(element))
+
+    def parse_expression(self, code):
+        """
+        Parses the code of an expression. Names are lowered without parsing.
+
+        :param code: The code of the expression.
+        :type code: str
+        :rtype: ast.expr
+        """
+        code = code.strip()
+        if _IDENTIFIER.match(code) and code not in _CONSTANTS:
+            return _node(ast.Name, id=code, ctx=_LOAD)
+        return self._parse(code, "eval")
+
+    def _parse_statements(self, code):
+        nodes = self._parse(code, "exec")
+        offset = self.new_lines(_line_count(code)) - 1
+        return _shift(nodes, offset) if offset else nodes
+
+    def _parse(self, code, mode):
+        key = (code, mode)
+        nodes = self._fragments.get(key)
+        if nodes is None:
+            nodes = ast.parse(code, mode=mode).body
+            self._fragments.put(key, nodes)
+        return nodes
+
+    def value(self, value):
+        """
+        Lowers a value, as written by ``format_literal``.
+
+        :rtype: ast.expr
+        """
+        lowering = _VALUES.get(type(value))
+        if lowering is None:
+            return self.parse_expression(_render(Literal(value)))
+        return lowering(self, value)
+
+    def body(self, container):
+        return self.statements(container.iter_body())
+
+    def class_def(self, element):
+        name, bases, decorators = element.header_fields()
+        lineno = self.new_lines(len(decorators) + 1)
+        if element.has_body():
+            # The blank line after the header.
+            self.new_lines()
+        return [_statement(
+            ast.ClassDef, lineno, name=name,
+            bases=[self.parse_expression(base) for base in bases],
+            body=self.body(element),
+            decorator_list=[self.expression(decorator)
+                            for decorator in decorators])]
+
+    def function_def(self, element):
+        name, parameters, decorators = element.header_fields()
+        return [_statement(
+            ast.FunctionDef, self.new_lines(len(decorators) + 1), name=name,
+            args=self.arguments(parameters),
+            body=self.body(element),
+            decorator_list=[self.expression(decorator)
+                            for decorator in decorators])]
+
+    def arguments(self, parameters):
+        """
+        Lowers the parameters of a function declaration.
+
+        :type parameters: Parameters
+        :rtype: ast.arguments
+        """
+        positional_args, optional_args = parameters.fields()[0].fields()
+        try:
+            key = ("arguments", tuple(positional_args), tuple(optional_args))
+            arguments = self._fragments.get(key)
+        except TypeError:
+            key = arguments = None
+        if arguments is not None:
+            return arguments
+
+        arguments = ast.arguments(args=[], vararg=None, kwarg=None,
+                                  defaults=[])
+        for name in positional_args:
+            name = str(name)
+            if name.startswith("**"):
+                arguments.kwarg = name[2:]
+            elif name.startswith("*"):
+                arguments.vararg = name[1:]
+            else:
+                arguments.args.append(_node(ast.Name, id=name, ctx=_PARAM))
+        for name, default in optional_args:
+            arguments.args.append(_node(ast.Name, id=name, ctx=_PARAM))
+            arguments.defaults.append(self.parse_expression(str(default)))
+        if key is not None:
+            self._fragments.put(key, arguments)
+        return arguments
+
+    def decorator(self, element):
+        name, parameters = element.fields()
+        function = self.parse_expression(name)
+        if parameters is None:
+            return function
+        positional_args, optional_args = parameters.fields()[0].fields()
+        return _node(
+            ast.Call, func=function,
+            args=[self.parse_expression(str(arg)) for arg in positional_args],
+            keywords=[ast.keyword(arg=name,
+                                  value=self.parse_expression(str(value)))
+                      for name, value in optional_args],
+            starargs=None, kwargs=None)
+
+    def if_statement(self, element):
+        # Elif chains are lowered iteratively, as they may be very long.
+        root = node = _statement(ast.If, self.new_lines(), test=None,
+                                 body=None, orelse=[])
+        while True:
+            condition, alternative = element.header_fields()
+            node.test = self.expression(condition)
+            node.body = self.body(element)
+            if isinstance(alternative, ElifStatement):
+                orelse = _statement(ast.If, self.new_lines(), test=None,
+                                    body=None, orelse=[])
+                node.orelse = [orelse]
+                node, element = orelse, alternative
+            else:
+                if alternative is not None:
+                    self.new_lines()
+                    node.orelse = self.body(alternative)
+                return [root]
+
+    def while_statement(self, element):
+        condition, body = element.fields()
+        node = _statement(ast.While, self.new_lines(),
+                          test=self.expression(condition),
+                          body=self.statement(body), orelse=[])
+        # The blank line after the body.
+        self.new_lines()
+        return [node]
+
+    def pass_statement(self, element):
+        return [_statement(ast.Pass, self.new_lines())]
+
+    def literal(self, element):
+        return self.value(element.fields()[0])
+
+    def bytes_literal(self, element):
+        return _node(ast.Str, s=element.fields()[0])
+
+    def sequence(self, node_class, element):
+        return _node(node_class,
+                     elts=[self.value(item) for item in element.fields()[0]],
+                     ctx=_LOAD)
+
+    def set_literal(self, element):
+        items = element.fields()[0]
+        if not items:
+            return self.parse_expression("set()")
+        return _node(ast.Set, elts=[self.value(item) for item in items])
+
+    def dict_literal(self, element):
+        pairs = element.fields()[0]
+        return _node(ast.Dict, keys=[self.value(key) for key, _ in pairs],
+                     values=[self.value(value) for _, value in pairs])
+
+    def text_statements(self, element):
+        return self._parse_statements(element.text)
+
+    def text_expression(self, element):
+        return self.parse_expression(element.text)
+
+    _STATEMENTS = {
+        TextCodeElement: text_statements,
+        Class: class_def,
+        FunctionDeclaration: function_def,
+        IfStatement: if_statement,
+        WhileStatement: while_statement,
+        Pass: pass_statement,
+    }
+
+    _EXPRESSIONS = {
+        TextCodeElement: text_expression,
+        Decorator: decorator,
+        Literal: literal,
+        BytesLiteral: bytes_literal,
+        ListLiteral: lambda self, element: self.sequence(ast.List, element),
+        TupleLiteral: lambda self, element: self.sequence(ast.Tuple, element),
+        SetLiteral: set_literal,
+        DictLiteral: dict_literal,
+    }
+
+
+def _line_count(code):
+    if not code:
+        return 0
+    return code.count("\n") + (not code.endswith("\n"))
+
+
+def _shift(nodes, offset):
+    """
+    Returns copies of parsed statements, moved ``offset`` lines down.
+    Only the statements are copied, since the lines of the expressions do
+    not affect tracebacks.
+    """
+    shifted = []
+    for node in nodes:
+        node = copy.copy(node)
+        node.lineno += offset
+        for field in _BLOCKS:
+            block = getattr(node, field, None)
+            if isinstance(block, list):
+                setattr(node, field, _shift(block, offset))
+        shifted.append(node)
+    return shifted
+
+
+_BLOCKS = ("body", "orelse", "handlers", "finalbody")
+_LITERALS = (Literal, CollectionLiteral)
+
+
+def _constant(self, value):
+    return _node(ast.Name, id=repr(value), ctx=_LOAD)
+
+
+def _number(self, value):
+    return _node(ast.Num, n=value)
+
+
+def _string(self, value):
+    return _node(ast.Str, s=value)
+
+
+def _dict(self, value):
+    items = sorted(value.iteritems())
+    return _node(ast.Dict, keys=[self.value(key) for key, _ in items],
+                 values=[self.value(item) for _, item in items])
+
+
+def _sequence(node_class):
+    def lower(self, value):
+        return _node(node_class, elts=[self.value(item) for item in value],
+                     ctx=_LOAD)
+    return lower
+
+
+_VALUES = {
+    type(None): _constant,
+    bool: _constant,
+    int: _number,
+    long: _number,
+    float: _number,
+    str: _string,
+    unicode: _string,
+    list: _sequence(ast.List),
+    tuple: _sequence(ast.Tuple),
+    dict: _dict,
+}
+
+
+def _lookup(lowerings, element):
+    element_class = type(element)
+    lowering = lowerings.get(element_class)
+    if lowering is None:
+        for cls in element_class.__mro__[1:]:
+            lowering = lowerings.get(cls)
+            if lowering is not None:
+                lowerings[element_class] = lowering
+                break
+    return lowering
+
+
+def _render(element):
+    stream = StringIO()
+    PythonSourceFile(stream).emit_element(element).flush()
+    return stream.getvalue()
+
+
+def compile_elements(elements, filename="<pyper>"):
+    """
+    Compiles top level code elements without emitting their code, using a
+    default ``AstBackend``.
+
+    :param elements: An iterable of code elements.
+    :param filename: The file name that tracebacks show.
+    :type filename: str
+    :return: A code object, as returned by ``compile``.
+    """
+    return _DEFAULT_BACKEND.compile(elements, filename)
+
+
+_DEFAULT_BACKEND = AstBackend()
@@ -0,0 +1,174 @@
+from collections import namedtuple
+from itertools import izip, repeat
+
+from pyper.core.cache import DEFAULT_FRAGMENT_CACHE, FrozenCodeElement
+from pyper.core.code import TextCodeElement
+from pyper.lang.python.code import Class, Decorator, Decorators, \
+    FunctionDeclaration, Parameters, format_literal
+
+#: A row of a class schema, as accepted by ``ClassBuilder.build_records``.
+ClassSchema = namedtuple("ClassSchema", ("name", "fields", "defaults",
+                                         "decorators", "parents"))
+ClassSchema.__new__.__defaults__ = ((), None, (), None)
+
+
+class ClassBuilder(object):
+    """
+    Builds data classes from schema rows, given either as records or as
+    columns.
+
+    Every class gets an ``__init__`` method that stores its fields as
+    attributes. Classes with the same fields and defaults share a single
+    ``__init__`` element, and classes with the same decorators and parents
+    share them as well, so building many classes from a repetitive schema
+    allocates little more than the classes themselves. The shared elements
+    have many parents, so the built classes should not be modified, except
+    for adding elements to their body.
+    """
+
+    DEFAULT_CACHE_SIZE = 4096
+
+    def __init__(self, parents=Class.OBJECT, freeze=True,
+                 cache=DEFAULT_FRAGMENT_CACHE,
+                 cache_size=DEFAULT_CACHE_SIZE):
+        """
+        :param parents: The default name/names of the super classes.
+        :type parents: (tuple | str)
+        :param freeze: Whether the shared ``__init__`` methods are frozen, so
+            they are rendered once per layout instead of once per class.
+        :type freeze: bool
+        :param cache: The cache of the rendered code of frozen methods.
+        :type cache: pyper.core.cache.FragmentCache
+        :param cache_size: The maximal number of shared elements of each kind
+            to keep. The shared elements are forgotten once there are more.
+        :type cache_size: int
+        """
+        self._freeze = freeze
+        self._cache = cache
+        self._cache_size = cache_size
+        self._initializers = {}
+        self._decorators = {}
+        self._parent_names = {}
+        self._parents = self._shared_parents(parents)
+
+    def build(self, name, fields=(), defaults=None, decorators=(),
+              parents=None):
+        """
+        Builds a single class.
+
+        :param name: The class name.
+        :type name: str
+        :param fields: The names of the fields, in the order of the
+            parameters of ``__init__``.
+        :param defaults: A mapping of field names to their default values,
+            which are written with ``format_literal``. The fields that have
+            defaults come after the ones that do not.
+        :type defaults: dict
+        :param decorators: The class decorators, as names or ``Decorator``
+            elements.
+        :param parents: The name/names of the super classes. Defaults to the
+            parents of the builder.
+        :type parents: (tuple | str)
+        :rtype: Class
+        """
+        cls = Class(name, (self._parents if parents is None
+                           else self._shared_parents(parents)),
+                    self._shared_decorators(decorators))
+        if fields:
+            cls.add_method(self._initializer(fields, defaults))
+        return cls
+
+    def build_records(self, records):
+        """
+        Builds a class for every record, lazily.
+
+        :param records: An iterable of ``ClassSchema`` records, or of tuples
+            of the arguments of ``build``.
+        :return: An iterator over the classes, that can be passed to
+            ``add_elements``.
+        """
+        build = self.build
+        for record in records:
+            yield build(*record)
+
+    def build_columns(self, names, fields=None, defaults=None,
+                      decorators=None, parents=None):
+        """
+        Builds a class for every item of ``names``, lazily. The other columns
+        hold the matching arguments of ``build``, and may be omitted.
+
+        :param names: The class names.
+        :param fields: The fields of every class.
+        :param defaults: The defaults of every class.
+        :param decorators: The decorators of every class.
+        :param parents: The parents of every class.
+        :return: An iterator over the classes, that can be passed to
+            ``add_elements``.
+        """
+        return self.build_records(izip(
+            names,
+            repeat(()) if fields is None else fields,
+            repeat(None) if defaults is None else defaults,
+            repeat(()) if decorators is None else decorators,
+            repeat(None) if parents is None else parents))
+
+    def _initializer(self, fields, defaults):
+        if defaults:
+            optional = tuple((field, format_literal(defaults[field]))
+                             for field in fields if field in defaults)
+            key = (tuple(fields), optional)
+        else:
+            optional = ()
+            key = fields if type(fields) is tuple else tuple(fields)
+        initializer = self._initializers.get(key)
+        if initializer is None:
+            required = ("self",) + tuple(field for field in fields
+                                         if not defaults or
+                                         field not in defaults)
+            initializer = FunctionDeclaration(
+                "__init__", Parameters(required, optional),
+                TextCodeElement("\n".join("self.%s = %s" % (field, field)
+                                          for field in fields)))
+            if self._freeze:
+                initializer = FrozenCodeElement(initializer, self._cache)
+            self._put(self._initializers, key, initializer)
+        return initializer
+
+    def _shared_decorators(self, decorators):
+        if not decorators:
+            return ()
+        key = tuple(decorators)
+        shared = self._decorators.get(key)
+        if shared is None:
+            shared = tuple(Decorators.get(decorator)
+                           if not isinstance(decorator, Decorator)
+                           else decorator
+                           for decorator in decorators)
+            self._put(self._decorators, key, shared)
+        return shared
+
+    def _shared_parents(self, parents):
+        key = (parents,) if isinstance(parents, str) else tuple(parents)
+        shared = self._parent_names.get(key)
+        if shared is None:
+            shared = key
+            self._put(self._parent_names, key, shared)
+        return shared
+
+    def _put(self, cache, key, value):
+        if len(cache) >= self._cache_size:
+            cache.clear()
+        cache[key] = value
+
+
+def build_classes(records, **options):
+    """
+    Builds classes from schema records, lazily, using a new
+    ``ClassBuilder``.
+
+    :param records: An iterable of ``ClassSchema`` records, or of tuples of
+        the arguments of ``ClassBuilder.build``.
+    :param options: The options of ``ClassBuilder``.
+    :return: An iterator over the classes.
+    """
+    return ClassBuilder(**options).build_records(records)
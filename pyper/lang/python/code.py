@@ -1,20 +1,111 @@
-from pyper.core.code import CodeElement
+from itertools import chain, imap
+
+from pyper.core.code import CodeElement, overrides
+from pyper.core.template import Slot
+from pyper.core.lazy import LazyElements, iter_elements, has_elements, \
+    contains_lazy_elements
 
 
 class Pass(CodeElement):
     """
     The ``pass`` expression.
+    Has a single, shared instance.
     """
+
+    __slots__ = ()
+
+    SHARED = True
+
+    def __new__(cls):
+        instance = cls.__dict__.get("_instance")
+        if instance is None:
+            instance = cls._instance = CodeElement.__new__(cls)
+        return instance
+
+    def fields(self):
+        return ()
+
     def emit(self, source_file):
         source_file.write_line("pass")
 
 
 class ContainerCodeElement(CodeElement):
 
+    __slots__ = ("_elements",)
+
+    CACHEABLE = True
+
     def __init__(self, body=None):
+        """
+        :param body: The first code element of the body, or an iterable of
+            code elements that is consumed lazily, as in ``add_elements``.
+        """
         self._elements = []
-        if body is not None:
-            self._elements.append(body)
+        if isinstance(body, CodeElement):
+            self._elements.append(self._adopt(body))
+        elif body is not None:
+            self._elements.append(LazyElements(body))
+
+    def add_element(self, element):
+        """
+        Adds a code element to the end of the body.
+
+        :param element: The code element.
+        :type element: CodeElement
+        """
+        self._elements.append(self._adopt(element))
+        self.mark_dirty()
+
+    def add_elements(self, elements):
+        """
+        Adds code elements to the end of the body, without consuming them.
+        The elements are pulled from ``elements`` only while the body is
+        emitted, and are not kept, so a container with lazily added elements
+        can be emitted only once.
+
+        :param elements: An iterable of code elements, such as a generator.
+        """
+        self._elements.append(LazyElements(elements))
+        self.mark_dirty()
+
+    def has_body(self):
+        """
+        Returns whether the body has any elements.
+        """
+        return has_elements(self._elements)
+
+    def iter_body(self):
+        """
+        Iterates over the body elements, pulling lazily added ones as needed.
+        An empty body consists of a single ``pass``.
+        """
+        empty = True
+        for element in iter_elements(self._elements):
+            empty = False
+            yield element
+        if empty:
+            yield Pass()
+
+    def fields(self):
+        if contains_lazy_elements(self._elements):
+            raise NotImplementedError("Lazily added elements cannot be "
+                                      "described without consuming them.")
+        return (self._elements,)
+
+    def header_fields(self):
+        """
+        Returns the fields of this element other than its body. Unlike
+        ``fields``, they can be described even if elements were added
+        lazily.
+
+        :rtype: tuple
+        """
+        return ()
+
+    def map_children(self, function):
+        self._elements = [element if isinstance(element, LazyElements)
+                          else function(element)
+                          for element in self._elements]
 
     def emit_header(self, source_file):
         """
@@ -37,6 +128,24 @@ class ContainerCodeElement(CodeElement):
         self.emit_body(source_file)
         self.emit_footer(source_file)
 
+    def emit_steps(self, source_file):
+        if overrides(self, ContainerCodeElement, ("emit", "emit_body")):
+            return CodeElement.emit_steps(self, source_file)
+        return self._body_steps(source_file)
+
+    def _body_steps(self, source_file):
+        self.emit_header(source_file)
+        source_file.indent()
+        for element in self.iter_body():
+            yield element
+        source_file.dedent()
+
+        if not source_file.is_new_line():
+            source_file.line_feed()
+
+        for element in self.emit_footer_steps(source_file):
+            yield element
+
     def emit_body(self, source_file):
         """
         Emits the body of this element. The body is indented one level relative
@@ -45,12 +154,8 @@ class ContainerCodeElement(CodeElement):
         :param source_file: The source file.
         :type source_file: pyper.core.source.SourceFile.
         """
-        if not self._elements:
-            self._elements.append(Pass())
-
         with source_file.indented_block():
-            for element in self._elements:
-                element.emit(source_file)
+            source_file.emit_elements(self.iter_body())
 
         if not source_file.is_new_line():
             source_file.line_feed()
@@ -65,12 +170,25 @@ class ContainerCodeElement(CodeElement):
         """
         pass
 
+    def emit_footer_steps(self, source_file):
+        """
+        Emits the footer in steps, like ``emit_steps``.
+
+        :param source_file: The source file.
+        :type source_file: pyper.core.source.SourceFile.
+        :return: An iterable of child code elements.
+        """
+        self.emit_footer(source_file)
+        return ()
+
 
 class Class(ContainerCodeElement):
 
+    __slots__ = ("_name", "_base_class_names", "_decorators")
+
     OBJECT = "object"
 
-    def __init__(self, name, parents=OBJECT):
+    def __init__(self, name, parents=OBJECT, decorators=()):
         """
         Initializes a new Class object.
 
@@ -78,40 +196,94 @@ class Class(ContainerCodeElement):
         :type name: str
         :param parents: The name/names of all the super classes of this class.
         :type parents: (tuple | str)
+        :param decorators: The class decorators.
+        :type decorators: tuple[Decorator]
         """
         ContainerCodeElement.__init__(self, body=None)
         self._name = name
         self._base_class_names = ((parents,) if isinstance(parents, str)
                                   else parents)
+        self._decorators = tuple(decorators)
+
+    @property
+    def name(self):
+        return self._name
+
+    def fields(self):
+        # The decorators come after the body, so the body keeps its position
+        # from before classes had decorators.
+        return ((self._name, self._base_class_names) +
+                ContainerCodeElement.fields(self) + (self._decorators,))
+
+    def header_fields(self):
+        return self._name, self._base_class_names, self._decorators
+
+    def map_children(self, function):
+        ContainerCodeElement.map_children(self, function)
+        self._decorators = tuple(function(decorator)
+                                 for decorator in self._decorators)
 
     def emit_header(self, source_file):
+        for decorator in self._decorators:
+            source_file.emit_element(decorator)
+
         parents = ", ".join(self._base_class_names)
         cls_declaration = "class %s(%s):" % (self._name, parents)
         source_file.write_line(cls_declaration)
-        if self._elements:
+        if self.has_body():
             source_file.line_feed()
 
     def add_method(self, method):
-        self._elements.append(method)
+        self.add_element(method)
+
+    def add_methods(self, methods):
+        """
+        Adds methods lazily, as in ``add_elements``.
+
+        :param methods: An iterable of methods, such as a generator.
+        """
+        self.add_elements(methods)
 
     def add_static_method(self, method):
         method.add_decorator(Decorators.STATICMETHOD)
         self.add_method(method)
 
+    def add_decorator(self, decorator):
+        self._decorators += (decorator,)
+        self.mark_dirty()
+
 
 class FunctionDeclaration(ContainerCodeElement):
 
+    __slots__ = ("_name", "_parameters", "_decorators")
+
     def __init__(self, name, parameters=None, body=None):
         ContainerCodeElement.__init__(self, body=body)
         self._name = name
-        self._parameters = (parameters
-                            if parameters is not None
-                            else Parameters())
-        self._decorators = []
+        self._parameters = (parameters if parameters is not None
+                            else _EMPTY_PARAMETERS)
+        self._decorators = ()
+
+    @property
+    def name(self):
+        return self._name
+
+    def fields(self):
+        return ((self._name, self._parameters, self._decorators) +
+                ContainerCodeElement.fields(self))
+
+    def header_fields(self):
+        return self._name, self._parameters, self._decorators
+
+    def map_children(self, function):
+        ContainerCodeElement.map_children(self, function)
+        self._parameters = function(self._parameters)
+        self._decorators = tuple(function(decorator)
+                                 for decorator in self._decorators)
 
     def emit_header(self, source_file):
         for decorator in self._decorators:
-            decorator.emit(source_file)
+            source_file.emit_element(decorator)
 
         source_file.write("def %s" % (self._name,))\
             .emit_element(self._parameters)\
@@ -119,26 +291,38 @@ class FunctionDeclaration(ContainerCodeElement):
             .line_feed()
 
     def add_decorator(self, decorator):
-        self._decorators.append(decorator)
+        self._decorators += (decorator,)
+        self.mark_dirty()
 
 
 class Decorator(CodeElement):
 
+    __slots__ = ("_name", "parameters")
+
     def __init__(self, name, parameters=None):
         self._name = name
         self.parameters = parameters
 
-    def emit(self, source_file):
-        source_file.write("@%s" % (self._name, ))
+    def fields(self):
+        return self._name, self.parameters
+
+    def map_children(self, function):
         if self.parameters is not None:
-            self.parameters.emit(source_file)
-        source_file.line_feed()
+            self.parameters = function(self.parameters)
+
+    def emit(self, source_file):
+        source_file.write("@%s" % (self._name, ))\
+            .emit_element(self.parameters)\
+            .line_feed()
 
 
 class VarArgsList(CodeElement):
     """
     Corresponds to the varargslist grammar variable of Python
     """
+
+    __slots__ = ("_positional_args", "_optional_args")
+
     def __init__(self, required_args=None, optional_args=None):
         """
         Initializes a VarArgsList.
@@ -146,8 +330,11 @@ class VarArgsList(CodeElement):
         :param required_args: A tuple of positional argument names.
         :param optional_args: A tuple of (name, default_value) pairs.
         """
-        self._positional_args = required_args
-        self._optional_args = optional_args
+        self._positional_args = tuple(required_args or ())
+        self._optional_args = tuple(optional_args or ())
+
+    def fields(self):
+        return self._positional_args, self._optional_args
 
     def emit(self, source_file):
         positional = (", ".join(str(arg) for arg in self._positional_args)
@@ -162,10 +349,23 @@ class VarArgsList(CodeElement):
         return bool(self._positional_args) or bool(self._optional_args)
 
 
+_EMPTY_VAR_ARGS_LIST = VarArgsList()
+
+
 class Parameters(CodeElement):
 
+    __slots__ = ("var_args_list",)
+
     def __init__(self, positional_args=None, named_args=None):
-        self.var_args_list = VarArgsList(positional_args, named_args)
+        self.var_args_list = (VarArgsList(positional_args, named_args)
+                              if positional_args or named_args
+                              else _EMPTY_VAR_ARGS_LIST)
+
+    def fields(self):
+        return (self.var_args_list,)
+
+    def map_children(self, function):
+        self.var_args_list = function(self.var_args_list)
 
     def emit(self, source_file):
         source_file.write("(")\
@@ -176,8 +376,13 @@ class Parameters(CodeElement):
         return self.var_args_list.__nonzero__()
 
 
+_EMPTY_PARAMETERS = Parameters()
+
+
 class ConditionedCodeElement(ContainerCodeElement):
 
+    __slots__ = ("_condition", "_alternative")
+
     KEYWORD = None
 
     def __init__(self, condition, body, alternative=None):
@@ -191,8 +396,21 @@ class ConditionedCodeElement(ContainerCodeElement):
         :type alternative: ElseStatement | ElifStatement
         """
         ContainerCodeElement.__init__(self, body)
-        self._condition = condition
-        self._alternative = alternative
+        self._condition = self._adopt(condition)
+        self._alternative = self._adopt(alternative)
+
+    def fields(self):
+        return ((self._condition, self._alternative) +
+                ContainerCodeElement.fields(self))
+
+    def header_fields(self):
+        return self._condition, self._alternative
+
+    def map_children(self, function):
+        ContainerCodeElement.map_children(self, function)
+        self._condition = function(self._condition)
+        if self._alternative is not None:
+            self._alternative = function(self._alternative)
 
     def emit_header(self, source_file):
         """
@@ -205,20 +423,26 @@ class ConditionedCodeElement(ContainerCodeElement):
             .line_feed()
 
     def emit_footer(self, source_file):
-        if self._alternative is not None:
-            self._alternative.emit(source_file)
+        source_file.emit_element(self._alternative)
+
+    def emit_footer_steps(self, source_file):
+        return (self._alternative,)
 
 
 class ElifStatement(ConditionedCodeElement):
+    __slots__ = ()
     KEYWORD = "elif"
 
 
 class IfStatement(ConditionedCodeElement):
+    __slots__ = ()
     KEYWORD = "if"
 
 
 class ElseStatement(ContainerCodeElement):
 
+    __slots__ = ()
+
     ELSE = "else"
 
     def emit_header(self, source_file):
@@ -230,9 +454,20 @@ class ElseStatement(ContainerCodeElement):
 
 class WhileStatement(CodeElement):
 
+    __slots__ = ("_condition", "_body")
+
+    CACHEABLE = True
+
     def __init__(self, condition, body):
-        self._condition = condition
-        self._body = body if body is not None else Pass()
+        self._condition = self._adopt(condition)
+        self._body = self._adopt(body if body is not None else Pass())
+
+    def fields(self):
+        return self._condition, self._body
+
+    def map_children(self, function):
+        self._condition = function(self._condition)
+        self._body = function(self._body)
 
     def emit(self, source_file):
         source_file.write("while ")\
@@ -242,16 +477,290 @@ class WhileStatement(CodeElement):
             .emit_indented(self._body)\
             .line_feed()
 
+    def emit_steps(self, source_file):
+        if overrides(self, WhileStatement, ("emit",)):
+            return CodeElement.emit_steps(self, source_file)
+        return self._body_steps(source_file)
+
+    def _body_steps(self, source_file):
+        source_file.write("while ")\
+            .emit_element(self._condition)\
+            .write(":")\
+            .line_feed()\
+            .indent()
+        yield self._body
+        source_file.dedent().line_feed()
+
+
+def _escape_bytes(value):
+    # string_escape escapes backslashes, single quotes and non printable
+    # characters. A single quote is always preceded by its own backslash, so
+    # un-escaping it cannot touch an escaped backslash.
+    return value.encode("string_escape").replace("\\'", "'").replace(
+        "\"", "\\\"")
+
+
+def _format_float(value):
+    if value != value:
+        return "float(\"nan\")"
+    if value in (_INFINITY, -_INFINITY):
+        return "float(\"%sinf\")" % ("-" if value < 0 else "")
+    return repr(value)
+
+
+def _format_sequence(items, opening, closing):
+    texts = [format_literal(item) for item in items]
+    if len(texts) == 1 and opening == "(":
+        return "(%s,)" % texts[0]
+    return opening + ", ".join(texts) + closing
+
+
+def format_literal(value):
+    """
+    Formats a value as a Python literal that evaluates back to it.
+    Supports ``None``, booleans, numbers, byte and unicode strings,
+    and lists, tuples, sets and dicts of supported values.
+    Nested containers are formatted on a single line.
+
+    A ``Slot`` is written as is, so the template it belongs to must be
+    filled with the literal's code, such as the result of this function.
+
+    :param value: The value to format.
+    :return: The literal's source code.
+    :rtype: str
+    """
+    formatter = _FORMATTERS.get(type(value))
+    if formatter is None:
+        for cls in type(value).__mro__:
+            formatter = _FORMATTERS.get(cls)
+            if formatter is not None:
+                break
+        else:
+            raise TypeError("Cannot format %r as a literal" % (value,))
+    return formatter(value)
+
+
+_INFINITY = float("inf")
+
+_FORMATTERS = {
+    Slot: str,
+    type(None): repr,
+    bool: repr,
+    int: str,
+    long: str,
+    float: _format_float,
+    str: lambda value: "\"%s\"" % _escape_bytes(value),
+    bytearray: lambda value: "bytearray(b\"%s\")" % _escape_bytes(str(value)),
+    unicode: lambda value: "u\"%s\"" % value.encode("unicode_escape").replace(
+        "\"", "\\\""),
+    list: lambda value: _format_sequence(value, "[", "]"),
+    tuple: lambda value: _format_sequence(value, "(", ")"),
+    set: lambda value: _format_sequence(
+        sorted(value), "{", "}") if value else "set()",
+    frozenset: lambda value: "frozenset(%s)" % _format_sequence(
+        sorted(value), "[", "]"),
+    dict: lambda value: "{%s}" % ", ".join(
+        "%s: %s" % (format_literal(key), format_literal(item))
+        for key, item in sorted(value.iteritems())),
+}
+
+
+class Literal(CodeElement):
+    """
+    A single value, written as a Python literal. See `format_literal`.
+    """
 
-class StringLiteral(CodeElement):
+    __slots__ = ("_value",)
 
     def __init__(self, value):
         self._value = value
 
+    def fields(self):
+        return (self._value,)
+
+    def emit(self, source_file):
+        source_file.write("%s", format_literal(self._value))
+
+
+class StringLiteral(Literal):
+    """
+    A string literal, escaped so it evaluates back to the given string.
+    """
+
+    __slots__ = ()
+
+
+class BytesLiteral(Literal):
+    """
+    A ``b""`` literal of a byte string, a bytearray or any other object
+    supporting the buffer interface.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, value):
+        Literal.__init__(self, value if isinstance(value, Slot)
+                         else str(buffer(value)))
+
+    def emit(self, source_file):
+        if isinstance(self._value, Slot):
+            source_file.write("%s", self._value)
+        else:
+            source_file.write("b\"%s\"", _escape_bytes(self._value))
+
+
+class CollectionLiteral(CodeElement):
+    """
+    A list, tuple, set or dict literal with any number of entries.
+
+    The items are consumed one by one and formatted straight to text, so
+    any iterable can be given: a generator, an ``array.array``, a numpy
+    array, etc. The entries are packed into lines no wider than
+    ``max_width`` (including the indentation), one indentation level
+    deeper than the opening bracket, and written a chunk of lines at a time.
+    An iterator can be emitted only once.
+    """
+
+    __slots__ = ("_items", "max_width")
+
+    OPENING = None
+    CLOSING = None
+    EMPTY = None
+
+    DEFAULT_MAX_WIDTH = 79
+    CHUNK_LINES = 1024
+
+    def __init__(self, items, max_width=DEFAULT_MAX_WIDTH):
+        """
+        :param items: An iterable of the items.
+        :param max_width: The maximal width of the lines of items. A single
+            item wider than this is written on its own line.
+        :type max_width: int
+        """
+        self._items = items
+        self.max_width = max_width
+
+    def fields(self):
+        items = self._items
+        if not isinstance(items, (list, tuple, basestring)):
+            items = tuple(self._items)
+            self._items = items
+        return (tuple(items), self.max_width)
+
+    def iter_texts(self):
+        """
+        Yields the formatted entries, without separators.
+        """
+        return imap(format_literal, self._items)
+
     def emit(self, source_file):
-        source_file.write("\"%s\"", self._value)
+        texts = self.iter_texts()
+        first = next(texts, None)
+        if first is None:
+            source_file.write(self.EMPTY)
+            return
+
+        source_file.write(self.OPENING).line_feed()
+        with source_file.indented_block():
+            width = max(self.max_width - source_file.indentation_width(), 1)
+            self._write_lines(source_file, chain((first,), texts), width)
+        source_file.write(self.CLOSING)
+
+    def _write_lines(self, source_file, texts, width):
+        lines = []
+        line = []
+        line_width = -1
+        for text in texts:
+            # Every entry is followed by a comma, and separated by a space.
+            text_width = len(text) + 1
+            if line and line_width + 1 + text_width > width:
+                lines.append(" ".join(line))
+                if len(lines) == self.CHUNK_LINES:
+                    lines.append("")
+                    source_file.write_lines(lines)
+                    lines = []
+                line = []
+                line_width = -1
+            line.append(text + ",")
+            line_width += 1 + text_width
+        lines.append(" ".join(line))
+        lines.append("")
+        source_file.write_lines(lines)
+
+
+class ListLiteral(CollectionLiteral):
+
+    __slots__ = ()
+
+    OPENING = "["
+    CLOSING = "]"
+    EMPTY = "[]"
+
+
+class TupleLiteral(CollectionLiteral):
+
+    __slots__ = ()
+
+    OPENING = "("
+    CLOSING = ")"
+    EMPTY = "()"
+
+
+class SetLiteral(CollectionLiteral):
+
+    __slots__ = ()
+
+    OPENING = "{"
+    CLOSING = "}"
+    EMPTY = "set()"
+
+
+class DictLiteral(CollectionLiteral):
+    """
+    A dict literal. The items are either a mapping, written in its
+    iteration order, or an iterable of key-value pairs.
+    """
+
+    __slots__ = ()
+
+    OPENING = "{"
+    CLOSING = "}"
+    EMPTY = "{}"
+
+    def fields(self):
+        items = self._items
+        if isinstance(items, dict):
+            return (tuple(items.iteritems()), self.max_width)
+        return CollectionLiteral.fields(self)
+
+    def iter_texts(self):
+        items = self._items
+        if isinstance(items, dict):
+            items = items.iteritems()
+        return ("%s: %s" % (format_literal(key), format_literal(value))
+                for key, value in items)
 
 
 class Decorators(object):
     STATICMETHOD = Decorator("staticmethod")
     CLASSMETHOD = Decorator("classmethod")
+
+    _shared = {
+        STATICMETHOD._name: STATICMETHOD,
+        CLASSMETHOD._name: CLASSMETHOD,
+    }
+
+    @classmethod
+    def get(cls, name):
+        """
+        Returns a decorator without parameters, shared by all the callers
+        asking for the same name. Shared decorators must not be modified.
+
+        :param name: The decorator name.
+        :type name: str
+        :rtype: Decorator
+        """
+        decorator = cls._shared.get(name)
+        if decorator is None:
+            decorator = cls._shared[name] = Decorator(name)
+        return decorator
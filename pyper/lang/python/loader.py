@@ -0,0 +1,164 @@
+import errno
+import imp
+import linecache
+import marshal
+import os
+from StringIO import StringIO
+import sys
+
+from pyper.core.files import AtomicFile
+from pyper.core.output_cache import structure_hash
+from pyper.core.source import SourceFile
+from pyper.lang.python.source import PythonSourceFile
+
+
+class InMemoryLoader(object):
+    """
+    A PEP 302 loader of a module whose code was generated in memory.
+    Also provides the source of the module, for tracebacks and ``inspect``.
+    """
+
+    def __init__(self, name, code, source):
+        """
+        :param name: The full name of the module.
+        :type name: str
+        :param code: The compiled code of the module.
+        :param source: The source code of the module.
+        :type source: str
+        """
+        self.name = name
+        self.code = code
+        self.source = source
+
+    @property
+    def filename(self):
+        return self.code.co_filename
+
+    def load_module(self, fullname):
+        """
+        Executes the module code in a new module, registered in
+        ``sys.modules``. The module is unregistered again if its code fails.
+
+        :param fullname: The full name of the module.
+        :type fullname: str
+        :return: The new module.
+        """
+        if fullname != self.name:
+            raise ImportError("Cannot load %s using the loader of %s" %
+                              (fullname, self.name))
+        module = imp.new_module(fullname)
+        module.__file__ = self.filename
+        module.__loader__ = self
+        _register_source(self.filename, self.source)
+        sys.modules[fullname] = module
+        try:
+            exec self.code in module.__dict__
+        except BaseException:
+            sys.modules.pop(fullname, None)
+            raise
+        # The code may replace its own module in sys.modules.
+        return sys.modules[fullname]
+
+    def get_source(self, fullname):
+        return self.source
+
+    def get_code(self, fullname):
+        return self.code
+
+    def is_package(self, fullname):
+        return False
+
+
+def _register_source(filename, source):
+    # Entries without a modification time are never invalidated by
+    # linecache.checkcache.
+    lines = source.splitlines(True)
+    linecache.cache[filename] = (len(source), None, lines, filename)
+
+
+def emit_source(elements, source_file_class=PythonSourceFile, **options):
+    """
+    Emits code into a string.
+
+    :param elements: Either a source file with elements added to it, or an
+        iterable of top level code elements.
+    :param source_file_class: The type of source file to emit the elements
+        with. Ignored if ``elements`` is a source file.
+    :param options: Extra arguments for ``source_file_class``.
+    :return: The emitted code.
+    :rtype: str
+    """
+    if isinstance(elements, SourceFile):
+        return "".join(elements.iter_emit())
+
+    stream = StringIO()
+    source_file = source_file_class(stream, **options)
+    for element in elements:
+        source_file.add_element(element)
+    source_file.emit()
+    return stream.getvalue()
+
+
+def load_module(name, elements, cache_dir=None,
+                source_file_class=PythonSourceFile, **options):
+    """
+    Generates a module and imports it without writing its code to disk.
+    The code is emitted into memory, compiled, and executed as a new module
+    registered in ``sys.modules`` under ``name``.
+
+    If ``cache_dir`` is given, the compiled code and the source are stored
+    there, keyed by the structure hash of the elements. Loading the same
+    elements again, even in another process, neither emits nor compiles
+    them. Caching requires elements that implement ``CodeElement.fields``
+    and have no lazily added children; any other elements, and a source
+    file, are always emitted and compiled.
+
+    :param name: The full name of the module.
+    :type name: str
+    :param elements: Either a source file with elements added to it, or an
+        iterable of top level code elements.
+    :param cache_dir: A directory to cache compiled code in. Created if
+        needed.
+    :type cache_dir: str
+    :param source_file_class: The type of source file to emit the elements
+        with. Ignored if ``elements`` is a source file.
+    :param options: Extra arguments for ``source_file_class``.
+    :return: The new module.
+    """
+    filename = "<pyper:%s>" % (name,)
+    key = None
+    if cache_dir is not None and not isinstance(elements, SourceFile):
+        elements = list(elements)
+        try:
+            key = structure_hash(elements, filename, imp.get_magic(),
+                                 source_file_class.__module__,
+                                 source_file_class.__name__,
+                                 sorted(options.items()))
+        except Exception:
+            # Elements that cannot describe their fields, such as lazily
+            # added children, are emitted and compiled without caching.
+            pass
+    if key is None:
+        source = emit_source(elements, source_file_class, **options)
+        code = compile(source, filename, "exec")
+        return InMemoryLoader(name, code, source).load_module(name)
+
+    path = os.path.join(cache_dir, key + ".pyper")
+    try:
+        with open(path, "rb") as cache_file:
+            source, code = marshal.load(cache_file)
+    except (IOError, EOFError, ValueError, TypeError):
+        source = emit_source(elements, source_file_class, **options)
+        code = compile(source, filename, "exec")
+        _store(path, source, code)
+    return InMemoryLoader(name, code, source).load_module(name)
+
+
+def _store(path, source, code):
+    try:
+        os.makedirs(os.path.dirname(path))
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    with AtomicFile(path) as cache_file:
+        cache_file.write(marshal.dumps((source, code)))
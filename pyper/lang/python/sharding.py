@@ -0,0 +1,203 @@
+import ast
+import os
+
+from pyper.core.code import TextCodeElement
+from pyper.core.files import AtomicFile
+from pyper.core.lazy import iter_elements
+from pyper.lang.python.code import DictLiteral
+
+
+class _Fragments(list):
+    write = list.append
+
+
+_IMPORTS = '''\
+"""
+Re-exports the names defined in the shards of this module.
+"""
+from importlib import import_module as _import_module
+import sys as _sys
+from types import ModuleType as _ModuleType
+
+_PACKAGE = __name__.rpartition(".")[0]
+
+'''
+
+_IMPORT_SHARD = '''
+
+
+def _import_shard(shard):
+    return _import_module("%s.%s" % (_PACKAGE, shard) if _PACKAGE else shard)
+
+
+__all__ = sorted(_SHARDS)
+'''
+
+_EAGER = '''
+for _name, _shard in _SHARDS.items():
+    globals()[_name] = getattr(_import_shard(_shard), _name)
+'''
+
+_LAZY = '''
+
+def __getattr__(name):
+    try:
+        shard = _SHARDS[name]
+    except KeyError:
+        raise AttributeError("module %r has no attribute %r" %
+                             (__name__, name))
+    value = globals()[name] = getattr(_import_shard(shard), name)
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_SHARDS))
+
+
+if _sys.version_info < (3, 7):
+    # Module level __getattr__ is supported only since Python 3.7.
+    class _LazyModule(_ModuleType):
+
+        def __getattr__(self, name):
+            value = __getattr__(name)
+            setattr(self, name, value)
+            return value
+
+        def __dir__(self):
+            return __dir__()
+
+    _module = _LazyModule(__name__, __doc__)
+    _module.__dict__.update(globals())
+    # Keeps this module, and so its globals, alive.
+    _module._original_module = _sys.modules[__name__]
+    _sys.modules[__name__] = _module
+'''
+
+
+def emit_sharded(source_file, name, directory, elements, max_lines=None,
+                 max_size=None, header=(), lazy=False):
+    """
+    Emits top level code elements into shard modules, and emits an
+    aggregator module that re-exports the public names they define into
+    ``source_file``.
+
+    Elements are added to a shard until it has at least ``max_lines`` lines
+    or ``max_size`` characters. A shard is never split in the middle of a
+    line, nor after a line that starts with a decorator, so text elements
+    may decorate the class or function that follows them. The top level
+    elements must not depend on each other otherwise, since they may end up
+    in different shards; Anything they share belongs in ``header``, which
+    is emitted at the top of every shard.
+
+    The code of every shard is parsed to find the names it assigns, defines
+    or imports.
+
+    :param source_file: The source file of the aggregator module. Shards are
+        emitted with the same type, indentation and line separator.
+    :type source_file: pyper.lang.python.source.PythonSourceFile
+    :param name: The name of the aggregator module, without its package.
+        The shards are named ``_<name>_<index>``.
+    :type name: str
+    :param directory: The directory to write the shards into. Must be the
+        directory of the aggregator module.
+    :type directory: str
+    :param elements: The top level code elements.
+    :param max_lines: The line budget of a shard.
+    :type max_lines: int
+    :param max_size: The size budget of a shard, in characters.
+    :type max_size: int
+    :param header: Code elements to emit at the top of every shard, such as
+        imports. The names they define are not re-exported.
+    :param lazy: Whether the aggregator imports every shard only when one
+        of its names is first accessed, instead of importing all of them.
+    :type lazy: bool
+    :return: The names of the shard modules.
+    :rtype: list[str]
+    """
+    shard_names = []
+    exports = {}
+    elements = iter_elements(elements)
+    while True:
+        fragments = _Fragments()
+        shard = source_file.fork(fragments)
+        for element in header:
+            shard.emit_element(element)
+        start = len(fragments)
+        names, size = _emit_shard(shard, fragments, elements, max_lines,
+                                  max_size)
+        if len(fragments) == start:
+            break
+
+        shard_name = "_%s_%d" % (name, len(shard_names))
+        shard_names.append(shard_name)
+        for defined_name in names:
+            if not defined_name.startswith("_"):
+                exports[defined_name] = shard_name
+        with AtomicFile(os.path.join(directory, shard_name + ".py")) as f:
+            f.write("".join(fragments))
+        if size is None:
+            break
+
+    source_file.emit_element(TextCodeElement(_IMPORTS))
+    source_file.write("_SHARDS = ")
+    source_file.emit_element(DictLiteral(sorted(exports.iteritems())))
+    source_file.emit_element(TextCodeElement(_IMPORT_SHARD))
+    source_file.emit_element(TextCodeElement(_LAZY if lazy else _EAGER))
+    source_file.flush()
+    return shard_names
+
+
+def _emit_shard(shard, fragments, elements, max_lines, max_size):
+    """
+    Emits elements into a shard until its budget is exhausted.
+
+    :return: The names the shard defines, and its size, or ``None`` for the
+        size if the elements ran out.
+    """
+    line_separator = shard.layout()[2]
+    lines = size = 0
+    first = start = len(fragments)
+    decorated = False
+    for element in elements:
+        shard.emit_element(element)
+        code = "".join(fragments[start:])
+        start = len(fragments)
+        lines += code.count(line_separator)
+        size += len(code)
+        code = code.rstrip()
+        if code:
+            decorated = code.rsplit("\n", 1)[-1].lstrip().startswith("@")
+
+        if shard.is_new_line() and not decorated and (
+                (max_lines is not None and lines >= max_lines) or
+                (max_size is not None and size >= max_size)):
+            return _defined_names("".join(fragments[first:])), size
+
+    return _defined_names("".join(fragments[first:])), None
+
+
+def _defined_names(code):
+    """
+    Returns the names that the top level statements of the code bind.
+    """
+    if not code:
+        return []
+    names = []
+    for statement in ast.parse(code).body:
+        if isinstance(statement, (ast.ClassDef, ast.FunctionDef)):
+            names.append(statement.name)
+        elif isinstance(statement, ast.Assign):
+            for target in statement.targets:
+                names.extend(_target_names(target))
+        elif isinstance(statement, (ast.Import, ast.ImportFrom)):
+            names.extend((alias.asname or alias.name).split(".")[0]
+                         for alias in statement.names if alias.name != "*")
+    return names
+
+
+def _target_names(target):
+    if isinstance(target, ast.Name):
+        return [target.id]
+    if isinstance(target, (ast.Tuple, ast.List)):
+        return [name for item in target.elts for name in _target_names(item)]
+    return []
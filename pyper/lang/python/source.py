@@ -1,4 +1,5 @@
 from pyper.core.source import SourceFile
+from pyper.lang.python import sharding
 
 
 class PythonSourceFile(SourceFile):
@@ -6,3 +7,29 @@ class PythonSourceFile(SourceFile):
     def __init__(self, stream, indentation=SourceFile.FOUR_SPACES, **kwargs):
         SourceFile.__init__(self, stream=stream, indentation=indentation,
                             **kwargs)
+
+    def emit_sharded(self, name, directory, max_lines=None, max_size=None,
+                     header=(), lazy=False):
+        """
+        Emits the elements into shard modules of limited size, and emits an
+        aggregator module that re-exports their names into this file.
+        Importing the aggregator lazily imports only the shards that are
+        used. See ``pyper.lang.python.sharding.emit_sharded``.
+
+        :param name: The name of this module, without its package.
+        :type name: str
+        :param directory: The directory of this module, to write the shards
+            into.
+        :type directory: str
+        :param max_lines: The line budget of a shard.
+        :type max_lines: int
+        :param max_size: The size budget of a shard, in characters.
+        :type max_size: int
+        :param header: Code elements to emit at the top of every shard.
+        :param lazy: Whether the aggregator imports shards lazily.
+        :type lazy: bool
+        :return: The names of the shard modules.
+        :rtype: list[str]
+        """
+        return sharding.emit_sharded(self, name, directory, self._elements,
+                                     max_lines, max_size, header, lazy)
@@ -1,5 +1,8 @@
 from StringIO import StringIO
 from unittest import TestCase
+from pyper.core.code import TextCodeElement
+from pyper.lang.python.code import Class, FunctionDeclaration, Parameters, \
+    IfStatement, ElseStatement, Literal, ListLiteral
 from pyper.lang.python.source import PythonSourceFile
 
 
@@ -13,3 +16,53 @@ class CodeTest(TestCase):
         self.assertEqual(expected_code, stream.getvalue())
         print(expected_code)
         stream.close()
+
+    def emit(self, elements=(), emit=PythonSourceFile.emit):
+        """
+        Emits elements into a new source file, and returns its code.
+
+        :param elements: The elements to add to the source file.
+        :param emit: Called with the source file to emit it.
+        :rtype: str
+        """
+        stream = StringIO()
+        source_file = PythonSourceFile(stream, indentation=self.indentation)
+        source_file.add_elements(elements)
+        emit(source_file)
+        code = stream.getvalue()
+        stream.close()
+        return code
+
+
+def build_class(name):
+    """
+    Builds a class whose methods repeat the same subtrees.
+    """
+    cls = Class(name)
+    for i in range(3):
+        method = FunctionDeclaration("method", Parameters(("self", "a")))
+        method.add_element(IfStatement(
+            TextCodeElement("a is None"),
+            TextCodeElement("raise ValueError()\n")))
+        method.add_element(Literal(i % 2 == 0))
+        cls.add_method(method)
+    return cls
+
+
+def build_tree():
+    """
+    Builds top level elements with many siblings.
+    """
+    cls = Class("Foo")
+    for i in range(20):
+        method = FunctionDeclaration("method%d" % (i,),
+                                     Parameters(("self", "a")))
+        method.add_element(IfStatement(
+            TextCodeElement("a == %d" % (i,)),
+            TextCodeElement("return %d\n" % (i,)),
+            ElseStatement(Literal(None))))
+        cls.add_method(method)
+    # Siblings that end in the middle of a line.
+    return [TextCodeElement("import os\n"), TextCodeElement("VALUE = "),
+            ListLiteral(range(3)), TextCodeElement("\n"), cls,
+            TextCodeElement("")]
@@ -0,0 +1,30 @@
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+from tests.core import CodeTest, build_tree
+
+
+class ConcurrentEmissionTest(CodeTest):
+
+    def emit_concurrent(self, executor, **kwargs):
+        return self.emit(build_tree(), lambda source_file:
+                         source_file.emit_concurrent(executor, **kwargs))
+
+    def check_executor(self, executor):
+        expected = self.emit(build_tree())
+        self.assertEqual(self.emit_concurrent(executor), expected)
+        self.assertEqual(self.emit_concurrent(executor, min_siblings=2),
+                         expected)
+
+    def test_thread_pool(self):
+        pool = ThreadPool(2)
+        try:
+            self.check_executor(pool)
+        finally:
+            pool.close()
+
+    def test_process_pool(self):
+        pool = Pool(2)
+        try:
+            self.check_executor(pool)
+        finally:
+            pool.close()
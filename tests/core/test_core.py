@@ -1,7 +1,14 @@
 from cStringIO import StringIO
+from StringIO import StringIO as TextStringIO
+import os
+import shutil
+import tempfile
 import unittest
+from pyper.core.cache import FragmentCache, freeze
 from pyper.core.code import CodeElement, TextCodeElement
-from pyper.core.source import SourceFile
+from pyper.core.files import WriteIfChangedFile
+from pyper.core.source import SourceFile, BinarySourceFile, \
+    MultiTargetSourceFile
 from tests.core import CodeTest
 
 
@@ -16,6 +23,87 @@ class SourceFileTest(unittest.TestCase):
         self.assertEqual(output_stream.getvalue(), expected)
         output_stream.close()
 
+    def test_buffered_output_is_identical(self):
+        def emit(**kwargs):
+            output_stream = StringIO()
+            s = SourceFile(output_stream, indentation=SourceFile.TAB,
+                           line_separator="\n", **kwargs)
+            s.add_element(TextCodeElement("hello"))
+            s.emit_indented(TextCodeElement("world"))
+            s.line_feed().write_line("foo").indent().write_line("bar")
+            s.emit()
+            value = output_stream.getvalue()
+            output_stream.close()
+            return value
+
+        expected = emit()
+        self.assertEqual(expected, emit(buffer_size=1))
+        self.assertEqual(expected, emit(buffer_size=1024))
+
+    def test_emit_async(self):
+        output_stream = StringIO()
+        s = SourceFile(output_stream, line_separator="\n")
+        for i in range(10):
+            s.add_element(TextCodeElement("line %d" % (i,)))
+            s.add_element(TextCodeElement("\n"))
+        drained = []
+        coroutine = s.emit_async(chunk_size=20,
+                                 drain=lambda: drained.append(True))
+        self.assertEqual(output_stream.getvalue(), "")
+        self.assertEqual(len(list(coroutine)), len(drained))
+        self.assertGreater(len(drained), 1)
+        self.assertEqual(output_stream.getvalue(),
+                         "".join("line %d\n" % (i,) for i in range(10)))
+        output_stream.close()
+
+    def test_buffered_output_is_written_on_flush(self):
+        output_stream = StringIO()
+        s = SourceFile(output_stream, buffer_size=1024)
+        s.write("hello")
+        self.assertEqual(output_stream.getvalue(), "")
+        s.flush()
+        self.assertEqual(output_stream.getvalue(), "hello")
+        output_stream.close()
+
+
+class BinarySourceFileTest(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def emit(self, s):
+        s.add_element(TextCodeElement(u"caf\xe9"))
+        s.emit_indented(freeze(TextCodeElement("hello"), FragmentCache()))
+        s.indent().line_feed().write("%d%%", 100).line_feed()
+        s.emit()
+
+    def read(self):
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def test_output_matches_text_output(self):
+        output_stream = TextStringIO()
+        self.emit(SourceFile(output_stream, line_separator="\r\n"))
+        expected = output_stream.getvalue().encode("utf-8")
+        output_stream.close()
+
+        s = BinarySourceFile.open(self.path, line_separator=u"\r\n",
+                                  block_size=4)
+        self.emit(s)
+        s.close()
+        self.assertEqual(expected, self.read())
+        self.assertIn(u"caf\xe9".encode("utf-8"), self.read())
+
+    def test_file_descriptor_output(self):
+        s = BinarySourceFile(os.open(self.path, os.O_WRONLY),
+                             encoding="latin-1")
+        s.write(u"caf\xe9").close()
+        self.assertEqual(u"caf\xe9".encode("latin-1"), self.read())
+
 
 class CoreCodeTest(CodeTest):
 
@@ -30,3 +118,173 @@ class CoreCodeTest(CodeTest):
         text.add_line("foo")
         text.add_line("bar")
         self.check_element_code_emission(text, expected)
+
+
+class CountingElement(CodeElement):
+    def __init__(self, text):
+        self.text = text
+        self.emit_count = 0
+
+    def emit(self, source_file):
+        self.emit_count += 1
+        source_file.write_line(self.text)
+
+
+class FrozenCodeElementTest(unittest.TestCase):
+
+    def emit(self, *elements):
+        output_stream = StringIO()
+        s = SourceFile(output_stream, indentation=SourceFile.TAB,
+                       line_separator="\n")
+        for element in elements:
+            s.emit_element(element)
+            s.emit_indented(element)
+        value = output_stream.getvalue()
+        output_stream.close()
+        return value
+
+    def test_frozen_element_is_rendered_once_per_layout(self):
+        element = CountingElement("hello")
+        frozen = freeze(element, FragmentCache())
+        expected = self.emit(CountingElement("hello"),
+                             CountingElement("hello"))
+        self.assertEqual(expected, self.emit(frozen, frozen))
+        self.assertEqual(element.emit_count, 2)
+
+    def test_cache_evicts_least_recently_used(self):
+        cache = FragmentCache(max_size=2)
+        cache.put("a", ("a", True))
+        cache.put("b", ("b", True))
+        cache.get("a")
+        cache.put("c", ("c", True))
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), ("a", True))
+
+
+class TextCodeElementTest(CodeTest):
+
+    def test_multiline_text_is_indented(self):
+        text = TextCodeElement("if x:\n    return 100%")
+        text.add_line("")
+        text.add_line("return 0\r\n")
+        output_stream = StringIO()
+        s = SourceFile(output_stream, indentation=SourceFile.TAB,
+                       line_separator="\r\n")
+        s.indent().write("y = 1; ").emit_element(text).emit_element(text)
+        self.assertEqual(output_stream.getvalue(),
+                         "\ty = 1; if x:\r\n"
+                         "\t    return 100%\r\n"
+                         "\r\n"
+                         "\treturn 0\r\n"
+                         "\tif x:\r\n"
+                         "\t    return 100%\r\n"
+                         "\r\n"
+                         "\treturn 0\r\n")
+        self.assertTrue(s.is_new_line())
+        output_stream.close()
+
+    def test_text(self):
+        text = TextCodeElement("a\nb")
+        text.add_line("c")
+        self.assertEqual(text.text, "a\nb\nc")
+        self.assertEqual(text.lines, ["a", "b", "c"])
+
+
+class MultiTargetSourceFileTest(unittest.TestCase):
+
+    FLAVOURS = [(SourceFile.TAB, "\n"), (SourceFile.FOUR_SPACES, "\r\n"),
+                (SourceFile.TWO_SPACES, "\n"), (SourceFile.TAB, "\n")]
+
+    @staticmethod
+    def emit(source_file, element):
+        source_file.write("x = ").emit_element(element).line_feed()
+        source_file.indent().emit_element(element)
+        source_file.indent().emit_element(element).dedent(2)
+        source_file.write_line("end")
+        source_file.flush()
+
+    def check_flavours(self, element):
+        expected = []
+        for indentation, line_separator in self.FLAVOURS:
+            stream = StringIO()
+            self.emit(SourceFile(stream, indentation=indentation,
+                                 line_separator=line_separator), element)
+            expected.append(stream.getvalue())
+
+        streams = [StringIO() for _ in self.FLAVOURS]
+        self.emit(MultiTargetSourceFile(
+            (stream,) + flavour
+            for stream, flavour in zip(streams, self.FLAVOURS)), element)
+        self.assertEqual([stream.getvalue() for stream in streams],
+                         expected)
+
+    def test_targets_get_their_own_layout(self):
+        self.check_flavours(TextCodeElement("if x:\n    y\n\nz"))
+
+    def test_rendered_elements(self):
+        self.check_flavours(freeze(TextCodeElement("a\nb\n"),
+                                   FragmentCache()))
+
+
+class WriteIfChangedFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, "file.py")
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write(self, *chunks):
+        with WriteIfChangedFile(self.path) as stream:
+            for chunk in chunks:
+                stream.write(chunk)
+        with open(self.path, "rb") as f:
+            self.assertEqual(f.read(), "".join(chunks))
+        self.assertEqual(os.listdir(self.root), ["file.py"])
+        return stream.changed
+
+    def test_new_file(self):
+        self.assertTrue(self.write("abc"))
+
+    def test_unchanged_file_is_untouched(self):
+        self.write("abc", "def")
+        os.utime(self.path, (0, 0))
+        self.assertFalse(self.write("ab", "cdef"))
+        self.assertEqual(os.stat(self.path).st_mtime, 0)
+
+    def test_changed_file(self):
+        self.write("abc", "def")
+        self.assertTrue(self.write("abc", "deg", "hij"))
+        self.assertTrue(self.write("abc"))
+        self.assertTrue(self.write("abc", "d"))
+
+    def test_changed_file_keeps_its_permissions(self):
+        self.write("abc")
+        os.chmod(self.path, 0o755)
+        self.assertTrue(self.write("abd"))
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o755)
+
+    def test_source_file_output(self):
+        def emit(text):
+            with WriteIfChangedFile(self.path) as stream:
+                source_file = BinarySourceFile(stream, block_size=2)
+                source_file.write_line(text).write_line(text).flush()
+            return stream.changed
+
+        self.assertTrue(emit("abc"))
+        self.assertFalse(emit("abc"))
+        self.assertTrue(emit("abd"))
+
+    def test_failed_write_is_discarded(self):
+        self.write("abc")
+        try:
+            with WriteIfChangedFile(self.path) as f:
+                f.write("x")
+                raise ValueError()
+        except ValueError:
+            pass
+        with open(self.path, "rb") as f:
+            self.assertEqual(f.read(), "abc")
+        self.assertEqual(os.listdir(self.root), ["file.py"])
@@ -0,0 +1,35 @@
+from pyper.core.code import TextCodeElement
+from pyper.core.instrumentation import EmissionProfiler
+from pyper.lang.python.code import Class, FunctionDeclaration, IfStatement
+from tests.core import CodeTest
+
+
+class ProfilerTest(CodeTest):
+
+    def test_profile(self):
+        cls = Class("Foo")
+        for name in ("foo", "bar", "baz"):
+            cls.add_method(FunctionDeclaration(
+                name, body=IfStatement(TextCodeElement("x"),
+                                       TextCodeElement("return x"))
+            ))
+        finished = []
+        profiler = EmissionProfiler(
+            callbacks=[lambda *args: finished.append(args)]
+        )
+
+        def emit(source_file):
+            source_file.set_profiler(profiler).emit()
+
+        code = self.emit([cls], emit)
+
+        report = profiler.report()
+        stats = dict((stats["name"], stats) for stats in report["elements"])
+        self.assertEqual(report["max_depth"], 4)
+        self.assertEqual(stats["Class"]["calls"], 1)
+        self.assertEqual(stats["FunctionDeclaration"]["calls"], 3)
+        self.assertEqual(stats["TextCodeElement"]["calls"], 6)
+        self.assertEqual(stats["Class"]["size"], len(code))
+        self.assertEqual(stats["Class"]["lines"], code.count("\n"))
+        self.assertEqual(len(finished), 19)
+        self.assertEqual(finished[-1][:2], (cls, 0))
@@ -0,0 +1,54 @@
+from pyper.core.cache import FrozenCodeElement
+from pyper.core.interning import Interner
+from pyper.lang.python.code import FunctionDeclaration, Literal
+from tests.core import CodeTest, build_class
+
+
+class InterningTest(CodeTest):
+
+    def test_structural_equality(self):
+        self.assertTrue(build_class("A").same_structure(build_class("A")))
+        self.assertFalse(build_class("A").same_structure(build_class("B")))
+        self.assertNotEqual(Literal(1).structure_key(),
+                            Literal(True).structure_key())
+        self.assertEqual(hash(Literal((1, "a")).structure_key()),
+                         hash(Literal((1, "a")).structure_key()))
+
+    def test_equal_subtrees_are_shared(self):
+        classes = [build_class("A"), build_class("B"), build_class("A")]
+        expected = self.emit([build_class(name) for name in "ABA"])
+        interner = Interner()
+        interned = interner.intern(classes)
+
+        self.assertIs(interned[0], interned[2])
+        self.assertIsNot(interned[0], interned[1])
+        methods = interned[1].fields()[2]
+        self.assertIs(methods[0], methods[2])
+        self.assertIsNot(methods[0], methods[1])
+        self.assertIs(interned[0].fields()[2][1], methods[1])
+        # Class, 2 methods, Parameters, VarArgsList, IfStatement, 2 texts,
+        # 2 literals, and the other class.
+        self.assertEqual(len(interner), 11)
+        self.assertEqual(self.emit(interned), expected)
+
+    def test_repeated_elements_are_frozen(self):
+        classes = [build_class(name) for name in "AB"]
+        expected = self.emit([build_class(name) for name in "AB"])
+        interned = Interner(freeze_repeated=True).intern(classes)
+        methods = interned[0].fields()[2]
+        self.assertIsInstance(methods[0], FrozenCodeElement)
+        self.assertIs(methods[0], interned[1].fields()[2][2])
+        self.assertNotIsInstance(interned[0], FrozenCodeElement)
+        self.assertEqual(self.emit(interned), expected)
+        self.assertEqual(self.emit(interned), expected)
+
+    def test_different_types_and_unhashable_values(self):
+        functions = [FunctionDeclaration(name, body=Literal(value))
+                     for name, value in (("f", [1, 2]), ("g", (1, 2)),
+                                         ("h", {1: 2}), ("i", {1: 2}))]
+        expected = self.emit(functions)
+        interned = Interner().intern(functions)
+        bodies = [function.fields()[3][0] for function in interned]
+        self.assertIsNot(bodies[0], bodies[1])
+        self.assertIsNot(bodies[2], bodies[3])
+        self.assertEqual(self.emit(interned), expected)
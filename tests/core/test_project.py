@@ -0,0 +1,134 @@
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+from pyper.core.code import CodeElement, TextCodeElement
+from pyper.core.output_cache import OutputCache
+from pyper.core.project import Project
+from pyper.core.source import BinarySourceFile
+
+
+class FailingElement(CodeElement):
+    def emit(self, source_file):
+        raise ValueError("failed")
+
+
+class UnhashableElement(TextCodeElement):
+    def fields(self):
+        raise RuntimeError("maximum recursion depth exceeded")
+
+
+class ProjectTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def read(self, path):
+        with open(os.path.join(self.root, path), "rb") as f:
+            return f.read()
+
+    def check_emission(self, **kwargs):
+        project = Project(self.root)
+        paths = ["file%d.txt" % (i,) for i in range(8)]
+        for path in paths:
+            project.add_file(os.path.join("sub", path),
+                             [TextCodeElement(path)])
+        project.add_file("failing.txt", [FailingElement()])
+
+        results = project.emit(**kwargs)
+
+        self.assertEqual([result.path for result in results],
+                         [os.path.join(self.root, "sub", path)
+                          for path in paths] +
+                         [os.path.join(self.root, "failing.txt")])
+        self.assertTrue(all(result.succeeded for result in results[:-1]))
+        self.assertIn("ValueError", results[-1].error)
+        for path in paths:
+            self.assertEqual(self.read(os.path.join("sub", path)), path)
+
+    def test_serial_emission(self):
+        self.check_emission(workers=1)
+
+    def test_thread_pool_emission(self):
+        self.check_emission(workers=4)
+
+    def test_process_pool_emission(self):
+        self.check_emission(workers=2, processes=True)
+
+    def test_unchanged_files_are_skipped(self):
+        cache_path = os.path.join(self.root, "cache.json")
+        elements = [TextCodeElement("foo"), TextCodeElement("bar")]
+        project = Project(self.root)
+        for element in elements:
+            project.add_file(element.text, [element])
+        project.add_file("failing.txt", [FailingElement()])
+
+        results = project.emit(workers=1, cache=OutputCache(cache_path))
+        self.assertFalse(any(result.skipped for result in results))
+
+        elements[1].add_line("baz")
+        results = project.emit(workers=1, cache=OutputCache(cache_path))
+        self.assertEqual([result.skipped for result in results],
+                         [True, False, False])
+        self.assertEqual(self.read("bar"), "bar\nbaz")
+        self.assertFalse(results[2].succeeded)
+
+    def test_changed_output_files_are_emitted(self):
+        cache_path = os.path.join(self.root, "cache.json")
+        project = Project(self.root)
+        project.add_file("foo", [TextCodeElement("foo")])
+        project.add_file("bar", [TextCodeElement("bar")])
+        project.emit(workers=1, cache=OutputCache(cache_path))
+
+        with open(os.path.join(self.root, "foo"), "w") as f:
+            f.write("fox")
+        with open(os.path.join(self.root, "bar"), "w") as f:
+            f.write("b")
+        results = project.emit(workers=1, cache=OutputCache(cache_path))
+        self.assertEqual([result.skipped for result in results],
+                         [False, False])
+        self.assertEqual(self.read("foo"), "foo")
+        self.assertEqual(self.read("bar"), "bar")
+        results = project.emit(workers=1, cache=OutputCache(cache_path))
+        self.assertEqual([result.skipped for result in results],
+                         [True, True])
+
+    def test_files_failing_to_hash_are_emitted(self):
+        cache_path = os.path.join(self.root, "cache.json")
+        project = Project(self.root)
+        project.add_file("deep", [UnhashableElement("deep")])
+        project.add_file("foo", [TextCodeElement("foo")])
+        for skipped in (False, True):
+            results = project.emit(workers=1,
+                                   cache=OutputCache(cache_path))
+            self.assertTrue(all(result.succeeded for result in results))
+            self.assertEqual([result.skipped for result in results],
+                             [False, skipped])
+        self.assertEqual(self.read("deep"), "deep")
+
+    def test_binary_source_files(self):
+        project = Project(self.root)
+        project.add_file("binary", [TextCodeElement(u"\u05d0")],
+                         BinarySourceFile)
+        self.assertTrue(project.emit(workers=1)[0].succeeded)
+        self.assertEqual(self.read("binary"), "\xd7\x90")
+
+    def test_file_permissions(self):
+        umask = os.umask(0)
+        os.umask(umask)
+        path = os.path.join(self.root, "script.py")
+        open(path, "wb").close()
+        os.chmod(path, 0o755)
+        project = Project(self.root)
+        project.add_file("new.py", [TextCodeElement("new")])
+        project.add_file("script.py", [TextCodeElement("script")])
+        project.emit(workers=1)
+
+        self.assertEqual(
+            stat.S_IMODE(os.stat(os.path.join(self.root, "new.py")).st_mode),
+            0o666 & ~umask)
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o755)
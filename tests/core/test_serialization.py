@@ -0,0 +1,73 @@
+from StringIO import StringIO
+from pyper.core import serialization
+from pyper.core.cache import DEFAULT_FRAGMENT_CACHE, FragmentCache, \
+    FrozenCodeElement
+from pyper.core.code import TextCodeElement
+from pyper.core.interning import Interner
+from pyper.lang.python.code import DictLiteral, SetLiteral, Literal
+from pyper.lang.python.builder import build_classes
+from tests.core import CodeTest, build_class, build_tree
+
+
+class SerializationTest(CodeTest):
+
+    def check_round_trip(self, compress):
+        elements = build_tree() + [
+            DictLiteral({"a": (1, 2.5, None), "b": [2 ** 40, u"c"]}),
+            Literal(0.0), Literal(-0.0),
+            SetLiteral(frozenset([1, 2]))]
+        data = serialization.dumps(elements, compress)
+        loaded = serialization.loads(data)
+        self.assertEqual(len(loaded), len(elements))
+        for element, loaded_element in zip(elements, loaded):
+            self.assertTrue(element.same_structure(loaded_element))
+        self.assertEqual(self.emit(loaded), self.emit(elements))
+        method = loaded[4].fields()[2][0]
+        self.assertIs(method._parent, loaded[4])
+
+    def test_round_trip(self):
+        self.check_round_trip(compress=False)
+
+    def test_compressed_round_trip(self):
+        self.check_round_trip(compress=True)
+
+    def test_shared_elements_stay_shared(self):
+        classes = Interner().intern([build_class("A")])
+        loaded, = serialization.loads(serialization.dumps(classes))
+        methods = loaded.fields()[2]
+        self.assertIs(methods[0], methods[2])
+        self.assertIsNot(methods[0], methods[1])
+
+    def check_frozen_round_trip(self, elements):
+        loaded = serialization.loads(serialization.dumps(elements))
+        self.assertEqual(self.emit(loaded), self.emit(elements))
+        return loaded
+
+    def test_builder_output(self):
+        classes = list(build_classes([("Foo", ("a", "b")),
+                                      ("Bar", ("a", "b"), {"b": 1})],
+                                     cache=FragmentCache()))
+        loaded = self.check_frozen_round_trip(classes)
+        initializer = loaded[0].fields()[2][0]
+        self.assertIsInstance(initializer, FrozenCodeElement)
+        self.assertIs(initializer._cache, DEFAULT_FRAGMENT_CACHE)
+
+    def test_frozen_interned_elements(self):
+        classes = Interner(freeze_repeated=True).intern(
+            [build_class(name) for name in "AB"])
+        loaded = self.check_frozen_round_trip(classes)
+        methods = loaded[0].fields()[2]
+        self.assertIsInstance(methods[0], FrozenCodeElement)
+        self.assertIs(methods[0], methods[2])
+
+    def test_elements_are_loaded_lazily(self):
+        data = serialization.dumps(
+            TextCodeElement("x = %d\n" % (i,)) for i in range(3))
+        elements = serialization.load(StringIO(data))
+        self.assertEqual(next(elements).text, "x = 0\n")
+        self.assertEqual(self.emit(elements), "x = 1\nx = 2\n")
+
+    def test_invalid_data(self):
+        self.assertRaises(ValueError, serialization.loads, "not pyper")
+        data = serialization.dumps([TextCodeElement("x")])
+        self.assertRaises(ValueError, serialization.loads, data[:-1])
@@ -0,0 +1,77 @@
+from StringIO import StringIO
+from pyper.core.code import TextCodeElement
+from pyper.core.template import Slot, Template
+from pyper.lang.python.code import Class, FunctionDeclaration, Parameters, \
+    StringLiteral, ListLiteral, format_literal
+from pyper.lang.python.source import PythonSourceFile
+from tests.core import CodeTest
+
+
+class TemplateTest(CodeTest):
+
+    def create_class(self, name, method, default, body):
+        cls = Class(name)
+        f = FunctionDeclaration(method, Parameters(("self",),
+                                                   (("value", default),)),
+                                TextCodeElement(body))
+        cls.add_method(f)
+        return cls
+
+    def test_filled_template_is_identical_to_emission(self):
+        rows = [("Foo", "get_%d" % (i,), i, "return {'%d': value}" % (i,))
+                for i in range(3)]
+
+        def emit_template(source_file):
+            template = Template(
+                self.create_class(Slot("name"), Slot("method"),
+                                  Slot("default"), Slot("body")),
+                source_file
+            )
+            self.assertEqual(template.slot_names,
+                             ["name", "method", "default", "body"])
+            template.emit(source_file, rows[0])
+            source_file.add_element(template.instance(rows[1])).emit()
+            template.emit_all(source_file, rows[2:])
+
+        self.assertEqual(
+            self.emit(self.create_class(*row) for row in rows),
+            self.emit(emit=emit_template))
+
+    def test_repeated_slot(self):
+        template = Template(TextCodeElement("%s = %s" % (Slot("a"),
+                                                         Slot("a"))),
+                            PythonSourceFile(StringIO()))
+        self.assertEqual(template.format((1,)), "1 = 1")
+
+    def test_literal_slots(self):
+        def function(name, value):
+            function = FunctionDeclaration(name, body=StringLiteral(value))
+            function.add_element(TextCodeElement("\nx = "))
+            function.add_element(ListLiteral([value, 1]))
+            return function
+
+        value = "a\"b\0"
+        template = Template(function(Slot("name"), Slot("value")),
+                            PythonSourceFile(StringIO()))
+        self.assertEqual(template.slot_names, ["name", "value"])
+        self.assertEqual(
+            template.format(("f", format_literal(value))),
+            self.emit([function("f", value)]))
+
+    def test_layout_mismatch(self):
+        source_file = PythonSourceFile(StringIO())
+        template = Template(Class(Slot("name")), source_file)
+        source_file.indent()
+        self.assertRaises(ValueError, template.emit, source_file, ("Foo",))
+
+    def test_multi_line_values(self):
+        source_file = PythonSourceFile(StringIO())
+        template = Template(FunctionDeclaration(
+            "f", body=TextCodeElement(Slot("body"))), source_file)
+        values = ("a = 1\nreturn a",)
+        self.assertRaises(ValueError, template.format, values)
+        self.assertRaises(ValueError, template.emit, source_file, values)
+        self.assertRaises(ValueError, template.emit_all, source_file,
+                          [("return 1",), values])
+        self.assertEqual(template.format(("return 1",)),
+                         "def f():\n    return 1\n")
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+import ast
+from StringIO import StringIO
+from unittest import TestCase
+from pyper.core.code import TextCodeElement
+from pyper.lang.python.ast_backend import AstBackend, compile_elements
+from pyper.lang.python.code import Class, FunctionDeclaration, Parameters, \
+    Decorator, Decorators, IfStatement, ElifStatement, ElseStatement, \
+    WhileStatement, Literal, ListLiteral, DictLiteral
+from pyper.lang.python.source import PythonSourceFile
+
+
+def build_tree():
+    prologue = TextCodeElement(
+        "def deco(*args, **kwargs):\n"
+        "    return lambda function: function\n"
+        "class Base(object):\n"
+        "    pass\n"
+        "class mixins:\n"
+        "    Mixin = object\n"
+        "TABLE = None\n")
+
+    method = FunctionDeclaration("method", Parameters(
+        ("self", "a"), (("b", "None"),)))
+    method.add_decorator(Decorator("deco", Parameters(("1",), (("x", "2"),))))
+    method.add_element(IfStatement(
+        TextCodeElement("a > 0"), TextCodeElement("return 'positive'\n"),
+        ElifStatement(
+            Literal(False), WhileStatement(DictLiteral([("a", (1, 2))]), None),
+            ElifStatement(
+                ListLiteral([]), None,
+                ElseStatement(TextCodeElement("return b\n"))))))
+    function = FunctionDeclaration(
+        "function", Parameters(("*args", "**kwargs")),
+        TextCodeElement("return TABLE\n"))
+    function.add_decorator(Decorators.STATICMETHOD)
+    table = IfStatement(ListLiteral([1, -2.5, u"א", None]),
+                        TextCodeElement("TABLE = 1\n"))
+
+    cls = Class("Foo", ("Base", "mixins.Mixin"))
+    cls.add_method(method)
+    cls.add_methods(iter([function]))
+    return [prologue, table, cls, Class("Empty", decorators=(
+        Decorators.get("deco"),))]
+
+
+class AstBackendTest(TestCase):
+
+    def test_lowered_tree_equals_parsed_code(self):
+        stream = StringIO()
+        source_file = PythonSourceFile(stream)
+        for element in build_tree():
+            source_file.add_element(element)
+        source_file.emit()
+
+        self.assertEqual(ast.dump(AstBackend().module(build_tree())),
+                         ast.dump(ast.parse(stream.getvalue())))
+
+    def test_compiled_code_runs(self):
+        namespace = {}
+        exec compile_elements(build_tree()) in namespace
+        foo = namespace["Foo"]()
+        self.assertEqual(foo.method(1), "positive")
+        self.assertEqual(foo.method(0, b=3), 3)
+        self.assertEqual(foo.function(), 1)
+
+    def test_expressions(self):
+        value = {"a": [1, {2: "b"}], "c": (None, True, 1.5)}
+        lowered = AstBackend().expression(DictLiteral(value))
+        expression = ast.fix_missing_locations(ast.Expression(body=lowered))
+        self.assertEqual(eval(compile(expression, "<test>", "eval")), value)
+
+    def test_line_numbers(self):
+        def statement_lines(module):
+            return [(type(node), node.lineno) for node in ast.walk(module)
+                    if isinstance(node, ast.stmt)]
+
+        def tree():
+            loop = FunctionDeclaration("loop", Parameters(("a",)),
+                                       WhileStatement(
+                                           TextCodeElement("a"),
+                                           TextCodeElement("a -= 1\n")))
+            loop.add_element(ListLiteral([1, 2]))
+            return build_tree() + [loop, TextCodeElement("x = loop(2)\n")]
+
+        stream = StringIO()
+        source_file = PythonSourceFile(stream)
+        for element in tree():
+            source_file.add_element(element)
+        source_file.emit()
+
+        self.assertEqual(statement_lines(AstBackend().module(tree())),
+                         statement_lines(ast.parse(stream.getvalue())))
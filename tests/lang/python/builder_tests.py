@@ -0,0 +1,77 @@
+from StringIO import StringIO
+from unittest import TestCase
+from pyper.lang.python.builder import ClassBuilder, ClassSchema, \
+    build_classes
+from pyper.lang.python.code import Decorator, Parameters
+from pyper.lang.python.source import PythonSourceFile
+
+EXPECTED = '''\
+@register
+class Point(object):
+
+    def __init__(self, x, y=0):
+        self.x = x
+        self.y = y
+@register
+class Size(object):
+
+    def __init__(self, x, y=0):
+        self.x = x
+        self.y = y
+class Empty(Base):
+    pass
+'''
+
+
+class ClassBuilderTest(TestCase):
+
+    def emit(self, classes):
+        stream = StringIO()
+        source_file = PythonSourceFile(stream)
+        source_file.add_elements(classes)
+        source_file.emit()
+        return stream.getvalue()
+
+    def test_build_records(self):
+        records = [
+            ClassSchema("Point", ("x", "y"), {"y": 0}, ("register",)),
+            ("Size", ["x", "y"], {"y": 0}, ("register",)),
+            ClassSchema("Empty", parents="Base"),
+        ]
+        self.assertEqual(self.emit(build_classes(records)), EXPECTED)
+
+    def test_build_columns(self):
+        classes = ClassBuilder(freeze=False).build_columns(
+            ["Point", "Size", "Empty"],
+            fields=[("x", "y"), ("x", "y"), ()],
+            defaults=[{"y": 0}, {"y": 0}, None],
+            decorators=[("register",), ("register",), ()],
+            parents=[None, None, ("Base",)])
+        self.assertEqual(self.emit(classes), EXPECTED)
+
+    def test_equal_parts_are_shared(self):
+        builder = ClassBuilder()
+        first = builder.build("A", ("a", "b"), {"b": None}, ("register",))
+        second = builder.build("B", ["a", "b"], {"b": None}, ["register"])
+        third = builder.build("C", ("a", "b"), {"b": 1})
+        initializer = first.fields()[2][0]
+        self.assertIs(initializer, second.fields()[2][0])
+        self.assertIsNot(initializer, third.fields()[2][0])
+        _, parents, decorators = first.header_fields()
+        self.assertIs(decorators, second.header_fields()[2])
+        self.assertIs(parents, third.header_fields()[1])
+
+    def test_explicit_parents_are_shared(self):
+        builder = ClassBuilder()
+        first = builder.build("A", parents=("Base", "Mixin"))
+        second = builder.build("B", parents=["Base", "Mixin"])
+        third = builder.build("C", parents="Base")
+        fourth = builder.build("D", parents=("Base",))
+        self.assertIs(first.header_fields()[1], second.header_fields()[1])
+        self.assertIs(third.header_fields()[1], fourth.header_fields()[1])
+
+    def test_decorator_elements(self):
+        decorator = Decorator("register", Parameters(("1",)))
+        cls = ClassBuilder().build("A", decorators=(decorator,))
+        self.assertEqual(self.emit([cls]),
+                         "@register(1)\nclass A(object):\n    pass\n")
@@ -1,6 +1,11 @@
+from StringIO import StringIO
+from array import array
 from pyper.core.code import TextCodeElement
 from pyper.lang.python.code import Class, Decorator, Parameters, IfStatement, \
-    ElseStatement, ElifStatement, ContainerCodeElement, FunctionDeclaration
+    ElseStatement, ElifStatement, ContainerCodeElement, FunctionDeclaration, \
+    WhileStatement, Pass, Decorators, StringLiteral, Literal, BytesLiteral, \
+    ListLiteral, TupleLiteral, DictLiteral, SetLiteral
+from pyper.lang.python.source import PythonSourceFile
 from tests.core import CodeTest
 
 
@@ -53,6 +58,13 @@ class ClassTest(CodeTest):
         cls.add_static_method(FunctionDeclaration("foo"))
         self.check_element_code_emission(cls, expected)
 
+    def test_class_decorators(self):
+        expected = "@foo\n" \
+                   "@bar(1)\n" + self.EMPTY_CLASS_TEMPLATE % ("A", "object")
+        cls = Class("A", decorators=(Decorator("foo"),))
+        cls.add_decorator(Decorator("bar", Parameters(("1",))))
+        self.check_element_code_emission(cls, expected)
+
 
 class ParametersTest(CodeTest):
     def test_positional_parameters(self):
@@ -167,3 +179,276 @@ class FunctionDeclarationTest(CodeTest):
             Decorator("decor2", Parameters(("a", "b")))
         )
         self.check_element_code_emission(f, expected)
+
+
+class CountingFunction(FunctionDeclaration):
+
+    emit_count = 0
+
+    def emit(self, source_file):
+        self.emit_count += 1
+        FunctionDeclaration.emit(self, source_file)
+
+
+class CommentedFunction(FunctionDeclaration):
+
+    def emit(self, source_file):
+        source_file.write("# counted").line_feed()
+        FunctionDeclaration.emit(self, source_file)
+
+
+class CommentedWhile(WhileStatement):
+
+    def emit(self, source_file):
+        source_file.write("# looped").line_feed()
+        WhileStatement.emit(self, source_file)
+
+
+class IncrementalEmissionTest(CodeTest):
+
+    def test_empty_class_emission_is_repeatable(self):
+        cls = Class("Foo")
+        self.assertEqual(self.emit([cls]), self.emit([cls]))
+
+    def test_only_changed_elements_are_rendered(self):
+        unchanged = CountingFunction("bar")
+        changed = CountingFunction("baz")
+        cls = Class("Foo")
+        cls.add_method(unchanged)
+        cls.add_method(changed)
+        other = Class("Other")
+        other.add_method(FunctionDeclaration("qux"))
+        elements = [cls, other]
+
+        self.emit(elements, PythonSourceFile.emit_incremental)
+        changed.add_decorator(Decorator("deco"))
+        cls.add_method(FunctionDeclaration("new"))
+        self.assertEqual(self.emit(elements),
+                         self.emit(elements,
+                                   PythonSourceFile.emit_incremental))
+        self.assertEqual(unchanged.emit_count, 2)
+        self.assertEqual(changed.emit_count, 3)
+        self.assertFalse(cls.is_dirty())
+
+
+class IterEmitTest(CodeTest):
+
+    def create_elements(self):
+        cls = Class("Foo")
+        cls.add_static_method(FunctionDeclaration(
+            "bar", Parameters(("a", "b")),
+            IfStatement(
+                condition=TextCodeElement("a"),
+                body=WhileStatement(TextCodeElement("b"), None),
+                alternative=ElifStatement(
+                    condition=TextCodeElement("b"),
+                    body=TextCodeElement("return b"),
+                    alternative=ElseStatement()
+                )
+            )
+        ))
+        cls.add_method(FunctionDeclaration("baz"))
+        return [cls, Class("Empty"), TextCodeElement("x = 1")]
+
+    def create_source_file(self, stream):
+        source_file = PythonSourceFile(stream, indentation=self.indentation)
+        for element in self.create_elements():
+            source_file.add_element(element)
+        return source_file
+
+    def test_iter_emit_is_identical_to_emit(self):
+        stream = StringIO()
+        self.create_source_file(stream).emit()
+        expected = stream.getvalue()
+        stream.close()
+
+        source_file = self.create_source_file(StringIO())
+        chunks = list(source_file.iter_emit(chunk_size=16))
+        self.assertEqual(expected, "".join(chunks))
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(len(chunk) >= 16 for chunk in chunks[:-1]))
+
+    def test_element_iter_emit(self):
+        source_file = PythonSourceFile(StringIO(),
+                                       indentation=self.indentation)
+        source_file.indent()
+        chunks = Class("Foo").iter_emit(source_file)
+        self.assertEqual("".join(chunks),
+                         "%sclass Foo(object):\n%s%spass\n" % (
+                             (self.indentation,) * 3))
+
+    def test_overridden_emit(self):
+        cls = Class("Foo")
+        cls.add_method(CommentedFunction(
+            "foo", body=CommentedWhile(TextCodeElement("x"), None)))
+        chunks = cls.iter_emit(PythonSourceFile(
+            StringIO(), indentation=self.indentation))
+        self.assertEqual("".join(chunks), self.emit([cls]))
+
+    def test_buffered_text_comes_first(self):
+        stream = StringIO()
+        source_file = PythonSourceFile(stream, indentation=self.indentation,
+                                       buffer_size=1024)
+        source_file.write("x = 1").line_feed()
+        for chunk in Class("Foo").iter_emit(source_file):
+            stream.write(chunk)
+        self.assertEqual(stream.getvalue(),
+                         "x = 1\nclass Foo(object):\n%spass\n" % (
+                             self.indentation,))
+
+
+class IterativeEmissionTest(CodeTest):
+
+    def create_chain(self, length):
+        statement = ElseStatement(TextCodeElement("return None"))
+        for i in range(length):
+            statement = ElifStatement(
+                condition=TextCodeElement("x == %d" % (i,)),
+                body=IfStatement(TextCodeElement("y"),
+                                 TextCodeElement("return %d" % (i,))),
+                alternative=statement
+            )
+        return IfStatement(TextCodeElement("x"), None, statement)
+
+    def test_iterative_emission_is_identical_to_emit(self):
+        chain = self.create_chain(50)
+        self.assertEqual(self.emit([chain]),
+                         self.emit([chain], PythonSourceFile.emit_iterative))
+
+    def test_overridden_emit(self):
+        cls = Class("Foo")
+        cls.add_method(CommentedFunction(
+            "foo", body=CommentedWhile(TextCodeElement("x"), None)))
+        code = self.emit([cls], PythonSourceFile.emit_iterative)
+        self.assertEqual(code, self.emit([cls]))
+        self.assertIn("    # counted\n", code)
+        self.assertIn("        # looped\n", code)
+
+    def test_deep_tree(self):
+        code = self.emit([self.create_chain(5000)],
+                         PythonSourceFile.emit_iterative)
+        self.assertEqual(code.count("elif "), 5000)
+
+
+class StructureTest(CodeTest):
+
+    def create_function(self, body):
+        f = FunctionDeclaration("foo", Parameters(("a",), (("b", 1),)),
+                                IfStatement(TextCodeElement("a"),
+                                            TextCodeElement(body)))
+        f.add_decorator(Decorator("deco"))
+        return f
+
+    def test_equal_trees_have_equal_structure(self):
+        self.assertEqual(self.create_function("return a").structure(),
+                         self.create_function("return a").structure())
+        self.assertNotEqual(self.create_function("return a").structure(),
+                            self.create_function("return b").structure())
+        self.assertNotEqual(Parameters(("a",)).structure(),
+                            Parameters(None, (("a", None),)).structure())
+        self.assertNotEqual(Literal([1, 2]).structure(),
+                            Literal((1, 2)).structure())
+
+
+class LazyBodyTest(CodeTest):
+
+    def create_methods(self, pulled):
+        for name in ("foo", "bar"):
+            pulled.append(name)
+            yield FunctionDeclaration(name, body=(
+                TextCodeElement("return %d\n" % (i,)) for i in range(2)
+            ))
+
+    def test_lazy_methods(self):
+        eager = Class("Foo")
+        for name in ("foo", "bar"):
+            f = FunctionDeclaration(name)
+            f.add_element(TextCodeElement("return 0\n"))
+            f.add_element(TextCodeElement("return 1\n"))
+            eager.add_method(f)
+
+        pulled = []
+        lazy = Class("Foo")
+        lazy.add_methods(self.create_methods(pulled))
+        self.assertEqual(pulled, [])
+
+        expected = self.emit(iter([lazy]))
+        self.assertEqual(pulled, ["foo", "bar"])
+        compile(expected, "<lazy>", "exec")
+        self.check_element_code_emission(eager, expected)
+
+    def test_empty_lazy_body(self):
+        cls = Class("Foo")
+        cls.add_methods(iter(()))
+        self.check_element_code_emission(cls, "class Foo(object):\n"
+                                              "    pass\n")
+
+
+class CompactRepresentationTest(CodeTest):
+
+    def test_elements_have_no_dict(self):
+        elements = [
+            Class("Foo"), FunctionDeclaration("foo"), Decorator("deco"),
+            Parameters(("a",)), IfStatement(StringLiteral("a"), Pass()),
+            ElifStatement(StringLiteral("a"), Pass()), ElseStatement(),
+            WhileStatement(StringLiteral("a"), None), Pass(),
+            TextCodeElement("a")
+        ]
+        for element in elements:
+            self.assertFalse(hasattr(element, "__dict__"), element)
+
+    def test_shared_elements(self):
+        self.assertIs(Pass(), Pass())
+        self.assertIs(Parameters().var_args_list,
+                      Parameters().var_args_list)
+        self.assertIs(Decorators.get("staticmethod"), Decorators.STATICMETHOD)
+        self.assertIs(Decorators.get("deco"), Decorators.get("deco"))
+        self.check_element_code_emission(Decorators.get("deco"), "@deco\n")
+
+
+class LiteralTest(CodeTest):
+
+    @staticmethod
+    def evaluate(element):
+        stream = StringIO()
+        PythonSourceFile(stream).write("value = ").emit_element(element)
+        namespace = {}
+        exec stream.getvalue() in namespace
+        return namespace["value"]
+
+    def test_literals_evaluate_to_their_values(self):
+        values = [
+            "a'b\"c\\", "\\'", "\x00\xff\n\t%s", u"\u05d0'\"\\\n",
+            1.5, float("inf"), -float("inf"), 10 ** 30, True, None, (1,),
+            [(1, "a"), {1: 2}], set([1, 2]), frozenset([3]),
+        ]
+        for value in values:
+            self.assertEqual(self.evaluate(Literal(value)), value)
+        self.assertEqual(self.evaluate(StringLiteral("%s\"")), "%s\"")
+        self.assertEqual(self.evaluate(BytesLiteral(bytearray("a\"\x01"))),
+                         "a\"\x01")
+
+    def test_unsupported_value(self):
+        self.assertRaises(TypeError, Literal(object()).emit,
+                          PythonSourceFile(StringIO()))
+
+    def test_wrapped_collection(self):
+        expected = (
+            "[\n"
+            "    0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, "
+            "17, 18, 19, 20,\n"
+            "    21, 22, 23, 24,\n"
+            "]")
+        self.check_element_code_emission(ListLiteral(xrange(25)), expected)
+        self.check_element_code_emission(TupleLiteral(["a"]),
+                                         "(\n    \"a\",\n)")
+        self.check_element_code_emission(SetLiteral(()), "set()")
+        self.check_element_code_emission(DictLiteral({}), "{}")
+
+    def test_large_collections(self):
+        numbers = array("i", xrange(100000))
+        self.assertEqual(self.evaluate(ListLiteral(numbers, max_width=40)),
+                         list(numbers))
+        pairs = ((str(i), i * 0.5) for i in xrange(10000))
+        self.assertEqual(self.evaluate(DictLiteral(pairs)),
+                         dict((str(i), i * 0.5) for i in xrange(10000)))
@@ -0,0 +1,70 @@
+import linecache
+import os
+import shutil
+import sys
+import tempfile
+from StringIO import StringIO
+from unittest import TestCase
+from pyper.core.code import CodeElement, TextCodeElement
+from pyper.lang.python.code import Class, FunctionDeclaration, Parameters
+from pyper.lang.python.loader import load_module
+from pyper.lang.python.source import PythonSourceFile
+
+
+class CountingFunction(FunctionDeclaration):
+    emissions = 0
+
+    def emit(self, source_file):
+        CountingFunction.emissions += 1
+        FunctionDeclaration.emit(self, source_file)
+
+
+class Assignment(CodeElement):
+
+    def emit(self, source_file):
+        source_file.write("z = 3").line_feed()
+
+
+class LoadModuleTest(TestCase):
+
+    def setUp(self):
+        self.cache_dir = os.path.join(tempfile.mkdtemp(), "cache")
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.cache_dir))
+        sys.modules.pop("generated", None)
+
+    def test_load_elements(self):
+        module = load_module("generated", [TextCodeElement("x = 1\n")])
+        self.assertEqual(module.x, 1)
+        self.assertIs(sys.modules["generated"], module)
+        self.assertEqual(linecache.getline(module.__file__, 1), "x = 1\n")
+
+    def test_load_source_file(self):
+        source_file = PythonSourceFile(StringIO())
+        source_file.add_element(TextCodeElement("y = 2\n"))
+        self.assertEqual(load_module("generated", source_file).y, 2)
+
+    def test_failing_module_is_not_registered(self):
+        self.assertRaises(ZeroDivisionError, load_module, "generated",
+                          [TextCodeElement("1 / 0\n")])
+        self.assertNotIn("generated", sys.modules)
+
+    def test_cached_code_is_not_emitted_again(self):
+        CountingFunction.emissions = 0
+        for _ in range(2):
+            module = load_module("generated", [CountingFunction("foo")],
+                                 cache_dir=self.cache_dir)
+            self.assertIsNone(module.foo())
+        self.assertEqual(CountingFunction.emissions, 1)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+    def test_elements_without_structure_are_not_cached(self):
+        cls = Class("Foo")
+        cls.add_methods(iter([
+            FunctionDeclaration("foo", Parameters(("self",)))]))
+        module = load_module("generated", [cls, Assignment()],
+                             cache_dir=self.cache_dir)
+        self.assertIsNone(module.Foo().foo())
+        self.assertEqual(module.z, 3)
+        self.assertFalse(os.path.exists(self.cache_dir))
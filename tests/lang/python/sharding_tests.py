@@ -0,0 +1,99 @@
+import math
+import os
+import shutil
+import sys
+import tempfile
+from StringIO import StringIO
+from unittest import TestCase
+from pyper.core.code import TextCodeElement
+from pyper.lang.python.code import Class, FunctionDeclaration, ListLiteral
+from pyper.lang.python.source import PythonSourceFile
+
+
+class ShardingTest(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.package = os.path.join(self.root, "generated")
+        os.mkdir(self.package)
+        open(os.path.join(self.package, "__init__.py"), "w").close()
+        sys.path.insert(0, self.root)
+
+    def tearDown(self):
+        sys.path.remove(self.root)
+        for name in list(sys.modules):
+            if name.startswith("generated"):
+                del sys.modules[name]
+        shutil.rmtree(self.root)
+
+    def emit(self, lazy):
+        stream = StringIO()
+        source_file = PythonSourceFile(stream)
+        for i in range(10):
+            source_file.add_element(Class("Class%d" % (i,)))
+            source_file.add_element(FunctionDeclaration(
+                "function%d" % (i,), body=TextCodeElement("return PI\n")))
+            source_file.add_element(TextCodeElement("TABLE%d = " % (i,)))
+            source_file.add_element(ListLiteral(range(i)))
+            source_file.add_element(TextCodeElement("\n_private = 1\n"))
+        shards = source_file.emit_sharded(
+            "tables", self.package, max_lines=6, lazy=lazy,
+            header=[TextCodeElement("from math import pi as PI\n")])
+        with open(os.path.join(self.package, "tables.py"), "w") as f:
+            f.write(stream.getvalue())
+        return shards
+
+    def check_module(self, lazy):
+        shards = self.emit(lazy)
+        self.assertEqual(len(shards), 10)
+        from generated import tables
+        self.assertEqual(len(tables.__all__), 30)
+        self.assertNotIn("_private", tables.__all__)
+        self.assertNotIn("PI", tables.__all__)
+        loaded = [name for name in sys.modules
+                  if name.startswith("generated._tables")]
+        self.assertEqual(len(loaded), 0 if lazy else 10)
+
+        self.assertEqual(tables.TABLE5, [0, 1, 2, 3, 4])
+        self.assertEqual(tables.function9(), math.pi)
+        self.assertIn("Class3", dir(tables))
+        self.assertRaises(AttributeError, getattr, tables, "missing")
+        loaded = [name for name in sys.modules
+                  if name.startswith("generated._tables")]
+        self.assertEqual(len(loaded), 2 if lazy else 10)
+
+    def test_eager_aggregator(self):
+        self.check_module(lazy=False)
+
+    def test_lazy_aggregator(self):
+        self.check_module(lazy=True)
+
+    def test_size_budget(self):
+        stream = StringIO()
+        source_file = PythonSourceFile(stream)
+        source_file.add_elements(TextCodeElement("VALUE%d = %d\n" % (i, i))
+                                 for i in range(100))
+        shards = source_file.emit_sharded("values", self.package,
+                                          max_size=200)
+        self.assertEqual(len(shards), 7)
+        with open(os.path.join(self.package, shards[-1] + ".py")) as f:
+            self.assertTrue(f.read().endswith("VALUE99 = 99\n"))
+
+    def test_decorators_stay_with_their_class(self):
+        stream = StringIO()
+        source_file = PythonSourceFile(stream)
+        for i in range(3):
+            source_file.add_element(TextCodeElement("@tag\n"))
+            source_file.add_element(Class("Class%d" % (i,)))
+        shards = source_file.emit_sharded(
+            "decorated", self.package, max_lines=1,
+            header=[TextCodeElement("def tag(cls):\n"
+                                    "    cls.tagged = True\n"
+                                    "    return cls\n")])
+        with open(os.path.join(self.package, "decorated.py"), "w") as f:
+            f.write(stream.getvalue())
+        self.assertEqual(len(shards), 3)
+        from generated import decorated
+        self.assertEqual(decorated.__all__, ["Class0", "Class1", "Class2"])
+        self.assertTrue(all(getattr(decorated, name).tagged
+                            for name in decorated.__all__))